@@ -1,12 +1,30 @@
 from pathlib import Path
 import os
+import numpy as np
 import pandas as pd
 import pdb
 import src.config as config
+import soundfile as sf
 from scipy.io import wavfile
+from concurrent.futures import ThreadPoolExecutor
+from src.flac_writer import audioWriters
 
 class AudioAnalyser:
-    def __init__(self, folder, subjectId, sessionId) -> None:
+    def __init__(self, folder, subjectId, sessionId, blocks=('Overt',), trialTypes=('StartSaying',), clipDuration=config.clipDuration) -> None:
+        """
+        Cuts the trials of one BIDS session audio folder into clips.
+
+        The session audio is memory-mapped (WAV) or read clip by clip (FLAC), so it is never
+        loaded whole, and every clip is written by a thread pool.
+
+        Parameters:
+        folder (str or Path): The session's audio folder holding the audio and events files.
+        subjectId (str): Subject folder name, e.g. 'sub-01'.
+        sessionId (str): Session folder name, e.g. 'ses-01'.
+        blocks (iterable): Blocks to keep, None keeps every block.
+        trialTypes (iterable): Trial types to keep, None keeps every trial type.
+        clipDuration (float): Length of every clip in seconds from the trial's audio onset.
+        """
         self.folder = folder
         self.audioFile = None
         self.eventsFile = None
@@ -15,47 +33,118 @@ class AudioAnalyser:
         self.loadAudioAndEvents()
         self.readAudio()
         self.readEvents()
-        self.extractOvertEvents()
+        self.extractTrials(blocks, trialTypes, clipDuration)
 
     def loadAudioAndEvents(self):
         files = os.listdir(self.folder)
-        
+
         eventsFile = [file for file in files if file.endswith('.tsv')][0]
-        audioFile = [file for file in files if file.endswith('.wav')][0]
+        audioFile = [file for file in files if file.endswith(('.wav', '.flac'))][0]
 
         self.eventsFile = Path(self.folder, eventsFile)
         self.audioFile = Path(self.folder, audioFile)
 
 
     def readAudio(self):
+        """Memory-map a WAV file; FLAC files are only opened to read their header, see readClip."""
         if self.audioFile:
-            self.sampleRate, self.audio = wavfile.read(self.audioFile)
+            if self.audioFile.suffix == '.flac':
+                self.sampleRate = sf.info(str(self.audioFile)).samplerate
+                self.audio = None
+            else:
+                self.sampleRate, self.audio = wavfile.read(self.audioFile, mmap=True)
 
     def readEvents(self):
 
         if self.eventsFile:
             self.events = pd.read_csv(self.eventsFile, delimiter='\t')
 
+    def trialBoundaries(self, blocks=None, trialTypes=None, clipDuration=config.clipDuration):
+        """
+        Selects trials with vectorized masks and computes their clip boundaries.
 
+        Clips start at the drift-corrected correctedAudioOnsetIndex, or at audioOnsetIndex for
+        events files written before that column existed.
 
-    def extractOvertEvents(self):
+        Parameters:
+        blocks (iterable): Blocks to keep, None keeps every block.
+        trialTypes (iterable): Trial types to keep, None keeps every trial type.
+        clipDuration (float): Clip length in seconds.
+
+        Returns:
+        pd.DataFrame: The selected events with 'clipStart' and 'clipStop' audio sample columns.
+        """
+        mask = np.ones(self.events.shape[0], dtype=bool)
+        if blocks is not None:
+            mask &= np.isin(self.events['block'].to_numpy(), list(blocks))
+        if trialTypes is not None:
+            mask &= np.isin(self.events['trialType'].to_numpy(), list(trialTypes))
+
+        trials = self.events[mask].reset_index(drop=True)
+        onsetColumn = 'correctedAudioOnsetIndex' if 'correctedAudioOnsetIndex' in trials else 'audioOnsetIndex'
+        trials['clipStart'] = trials[onsetColumn].to_numpy(dtype=np.int64)
+        trials['clipStop'] = trials['clipStart'] + int(clipDuration * self.sampleRate)
+        return trials
+
+    def readClip(self, start, stop):
+        """Return audio samples [start, stop) from the memory map, or by seeking in a FLAC file."""
+        if self.audio is not None:
+            return self.audio[start:stop]
+        with sf.SoundFile(str(self.audioFile)) as audioFile:
+            audioFile.seek(min(start, audioFile.frames))
+            dtype = 'int16' if audioFile.subtype in ('PCM_16', 'PCM_S8') else 'int32'
+            return audioFile.read(stop - start, dtype=dtype)
+
+    def writeClip(self, start, stop, audioName):
+        audioWriters[config.audioExportFormat](self.readClip(start, stop), audioName, self.sampleRate)
+        return audioName
+
+    def extractTrials(self, blocks=None, trialTypes=None, clipDuration=config.clipDuration):
+        """
+        Writes one clip per selected trial to currDir/Audios/<subject>/<session>/<start>_<word>.<format>.
+
+        Parameters:
+        blocks (iterable): Blocks to keep, None keeps every block.
+        trialTypes (iterable): Trial types to keep, None keeps every trial type.
+        clipDuration (float): Clip length in seconds.
+
+        Returns:
+        list: Paths of the written clips.
+        """
         print('************************Extracting Audio****************')
         destination = Path(Path(Path(config.currDir,'Audios'),self.syubjectID), self.sessionId)
         os.makedirs(destination, exist_ok=True)
 
-        overt = self.events[self.events['block']=='Overt']
-        overt = overt[overt['trialType'] == 'StartSaying']
-        overt.reset_index(inplace=True)
+        trials = self.trialBoundaries(blocks, trialTypes, clipDuration)
+        with ThreadPoolExecutor(max_workers=config.numWorkers) as executor:
+            futures = [
+                executor.submit(
+                    self.writeClip, start, stop, Path(destination, f'{start}_{word}.{config.audioExportFormat}')
+                )
+                for start, stop, word in zip(trials['clipStart'], trials['clipStop'], trials['word'])
+            ]
+            return [future.result() for future in futures]
+
+    def extractOvertEvents(self):
+        return self.extractTrials(['Overt'], ['StartSaying'])
 
-        for index in range(overt.shape[0]):
-            
-            start = overt['audioOnsetIndex'][index]
-            word = overt['word'][index] 
-            end = int(start + 1.5*self.sampleRate)
+def analyseBidsAudio(bidsDir=config.bidsDir, blocks=('Overt',), trialTypes=('StartSaying',), clipDuration=config.clipDuration):
+    """
+    Runs AudioAnalyser over every sub-*/ses-*/audio folder of a BIDS tree.
 
-            audioSample = self.audio[start: end]
-            audioName = Path(destination, f'{start}_{word}.wav')
+    Parameters:
+    bidsDir (str or Path): Root of the BIDS tree.
+    blocks, trialTypes, clipDuration: Trial selection, see AudioAnalyser.
 
-            wavfile.write(audioName, self.sampleRate, audioSample)
-            
-            
\ No newline at end of file
+    Returns:
+    list: One AudioAnalyser per session audio folder.
+    """
+    analysers = []
+    for folder in sorted(Path(bidsDir).glob('sub-*/ses-*/audio')):
+        subjectId, sessionId = folder.parts[-3], folder.parts[-2]
+        print(f'Analysing audio of {subjectId} {sessionId}')
+        analysers.append(AudioAnalyser(
+            folder, subjectId=subjectId, sessionId=sessionId,
+            blocks=blocks, trialTypes=trialTypes, clipDuration=clipDuration
+        ))
+    return analysers
@@ -1,13 +1,34 @@
 import src.config as config
-from src.utils import loadXdfFile
-from src.utils import adjustAudioTime, findNearestIndices
+import numpy as np
+from src.utils import loadXdfMarkersAndAudio
+from src.utils import adjustAudioTime
+from src.timebase import Timebase
+from src.event_table import EventTable
+from src.event_sync import estimateClockOffset, splitAudioEventName
 import pdb
 
 class AudioDataProcessor:
-    def __init__(self, filepath):
-        self.rawData = loadXdfFile(filepath)
+    def __init__(self, filepath, markersOnly=False):
+        """
+        Parameters:
+        filepath (str): The filepath to the XDF file.
+        markersOnly (bool): Decode only the marker stream. Audio samples are loaded later 
+            with loadAudio().
+        """
+        self.filepath = filepath
+        self.markersOnly = markersOnly
+        self.markerStream, self.audioStream, self.audioInfo, self.header = loadXdfMarkersAndAudio(
+            filepath, markersOnly=markersOnly
+        )
         self.setupEegDataInfo()
 
+    def loadAudio(self):
+        """Decode the audio stream of a file opened with markersOnly and remap the events."""
+        if self.audioStream is not None:
+            return
+        _, self.audioStream, _, _ = loadXdfMarkersAndAudio(self.filepath)
+        self.markersOnly = False
+        self.setupEegDataInfo()
     
     def setupEegDataInfo(self):
         
@@ -16,29 +37,33 @@ class AudioDataProcessor:
         """
         print('***************************Loading Audio data***************************')
         
-        self.samplingFrequency = self.rawData[0][1]['info']['effective_srate']
-        self.markers = self.rawData[0][0]['time_series']
-        self.audio = self.rawData[0][1]['time_series']
-        self.markersTimeStamps = self.rawData[0][0]['time_stamps']
-        self.audioTimeStamps = self.rawData[0][1]['time_stamps']
+        self.markers = self.markerStream['time_series']
+        self.rawMarkersTimeStamps = self.markerStream['time_stamps']
         self.nMarkers = len(self.markers)
+        if self.audioStream is None:
+            self.samplingFrequency = float(self.audioInfo['nominal_srate'])
+            self.audio = None
+            self.rawAudioTimeBase = None
+        else:
+            self.samplingFrequency = self.audioStream['info']['effective_srate']
+            self.audio = self.audioStream['time_series']
+            self.rawAudioTimeBase = Timebase.fromTimestamps(
+                self.audioStream.pop('time_stamps'), self.samplingFrequency
+            )
         print('***************************Audio data loaded***************************')
         
         self.mapAudioEvents()
 
-    def mapAudioEvents(self, timeDifference=config.timeDifference):
-        print('***************************Mapping Audio events***************************')
-        markersMappingIndexs = findNearestIndices(self.audioTimeStamps, self.markersTimeStamps)
-        self.audioTimeStamps = adjustAudioTime(self.audioTimeStamps, timeDifference)
-        self.audioStartTime = self.audioTimeStamps[0]
-        self.audioEndTime = self.audioTimeStamps[-1]
-        self.audioDuration = self.audioEndTime - self.audioStartTime
-        self.markersTimeStamps = adjustAudioTime(self.markersTimeStamps, timeDifference)
-        self.markersStartTime = self.markersTimeStamps[0]
-        self.markersEndTime = self.markersTimeStamps[-1]
-        events = []
+    def decodeMarkers(self):
+        """
+        Translate the marker strings into (event, block) pairs, carrying the block forward.
+
+        Returns:
+        list: One (event, block) tuple per marker.
+        """
+        decoded = []
         block = None
-        for index in range(len(markersMappingIndexs)):
+        for index in range(self.nMarkers):
             marker = self.markers[index][0]
             if 'BlockSaying' in marker:
                 block = 'Overt'
@@ -50,15 +75,69 @@ class AudioDataProcessor:
                 event = 'Fixation'
             else:
                 event = marker
-            onset = self.audioTimeStamps[markersMappingIndexs[index]]    
-            onsetIndex = markersMappingIndexs[index]
-            try:
-                duration = markersMappingIndexs[index+1] - onsetIndex
-            except:
-                duration = 0
-            events.append([event, block, onset, duration, onsetIndex])
-        self.audioEvents = events
-        print('***************************Audio events mapped***************************')  
-        
+            decoded.append((event, block))
+        return decoded
+
+    def mapAudioEvents(self, timeDifference=config.timeDifference):
+        print('***************************Mapping Audio events***************************')
+        if self.rawAudioTimeBase is None:
+            self.mapMarkerEvents(timeDifference)
+            return
+        markersMappingIndexs = self.rawAudioTimeBase.timeToIndex(self.rawMarkersTimeStamps)
+        self.audioTimeBase = self.rawAudioTimeBase.shift(adjustAudioTime(0, timeDifference))
+        self.audioStartTime = self.audioTimeBase.startTime
+        self.audioEndTime = self.audioTimeBase.endTime
+        self.audioDuration = self.audioEndTime - self.audioStartTime
+        self.markersTimeStamps = adjustAudioTime(self.rawMarkersTimeStamps, timeDifference)
+        self.markersStartTime = self.markersTimeStamps[0]
+        self.markersEndTime = self.markersTimeStamps[-1]
+        markersMappingIndexs = np.asarray(markersMappingIndexs)
+        names, blocks = zip(*self.decodeMarkers())
+        self.audioEvents = EventTable({
+            'event': names, 'block': blocks, 'onset': self.audioTimeBase.indexToTime(markersMappingIndexs),
+            'duration': np.append(np.diff(markersMappingIndexs), 0), 'onsetIndex': markersMappingIndexs
+        }, categorical=('event', 'block'))
+        print('***************************Audio events mapped***************************')
+
+    def mapMarkerEvents(self, timeDifference=config.timeDifference):
+        """
+        Build the events table from the marker stream alone, before the audio is decoded.
+
+        Onsets are the marker timestamps. Onset indexes and durations are -1 until 
+        loadAudio() maps the markers onto audio samples.
+        """
+        self.markersTimeStamps = adjustAudioTime(self.rawMarkersTimeStamps, timeDifference)
+        self.markersStartTime = self.markersTimeStamps[0]
+        self.markersEndTime = self.markersTimeStamps[-1]
+        self.audioStartTime = self.markersStartTime
+        self.audioEndTime = self.markersEndTime
+        self.audioDuration = self.audioEndTime - self.audioStartTime
+        names, blocks = zip(*self.decodeMarkers())
+        unmapped = np.full(len(names), -1, dtype=np.int64)
+        self.audioEvents = EventTable({
+            'event': names, 'block': blocks, 'onset': np.asarray(self.markersTimeStamps, dtype=np.float64),
+            'duration': unmapped, 'onsetIndex': unmapped.copy()
+        }, categorical=('event', 'block'))
+        print('***************************Audio events mapped***************************')
+
+    def detectTimeDifference(self, eegData):
+        """
+        Estimate the XDF/EDF clock offset from the event trains and remap the audio events with it.
+
+        Parameters:
+        eegData (EegDataProcessor): EEG recording whose eegEvents are used as reference.
+
+        Returns:
+        float: The detected time difference in hours.
+        """
+        print('***************************Detecting Audio/EEG time difference***************************')
+        offset, residual, nMatched = estimateClockOffset(
+            eegData.eegEvents['onset'], eegData.eegEvents['event'].tolist(),
+            self.rawMarkersTimeStamps, [splitAudioEventName(event)[0] for event, _ in self.decodeMarkers()]
+        )
+        self.timeDifference = offset / 3600
+        self.clockOffsetResidual = residual
+        print(f'Time difference: {self.timeDifference:.6f}h, residual {residual * 1000:.1f}ms over {nMatched}/{self.nMarkers} markers')
+        self.mapAudioEvents(timeDifference=self.timeDifference)
+        return self.timeDifference
 
-    
\ No newline at end of file
@@ -0,0 +1,194 @@
+import os
+import csv
+import json
+import time
+import traceback
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import src.config as config
+from src.eeg_data_utils import loadSharedEegData, releaseSharedEegData
+from src.audio_data_utils import AudioDataProcessor
+from src.eeg_audio_data import EegAudioDataProcessor
+from src.pipeline_stages import SessionPipeline
+import pdb
+
+manifestColumns = ['subjectId', 'sessionId', 'runId', 'taskName', 'edfPath', 'xdfPath']
+summaryColumns = ['subjectId', 'sessionId', 'runId', 'taskName', 'status', 'seconds', 'nTrials', 'error']
+
+def loadManifest(manifestPath):
+    """
+    Reads the list of sessions to convert from a CSV, TSV or JSON manifest.
+
+    Every session needs subjectId, sessionId, edfPath and xdfPath; runId defaults to '01' and
+    taskName to 'VCV'. JSON manifests are a list of objects with the same keys.
+
+    Parameters:
+    manifestPath (str or Path): Path to the manifest file.
+
+    Returns:
+    list: One dict per session with the manifestColumns keys, all values as strings.
+    """
+    manifestPath = Path(manifestPath)
+    if manifestPath.suffix == '.json':
+        with open(manifestPath, encoding='utf-8') as manifestFile:
+            rows = json.load(manifestFile)
+    else:
+        delimiter = ',' if manifestPath.suffix == '.csv' else '\t'
+        with open(manifestPath, newline='', encoding='utf-8') as manifestFile:
+            rows = list(csv.DictReader(manifestFile, delimiter=delimiter))
+
+    sessions = []
+    for row in rows:
+        session = {'runId': '01', 'taskName': 'VCV'}
+        session.update({key: str(value).strip() for key, value in row.items() if value not in (None, '')})
+        missing = [column for column in manifestColumns if column not in session]
+        if missing:
+            raise ValueError(f'Manifest row {row} is missing {missing}')
+        sessions.append(session)
+    return sessions
+
+def groupSessionsByEdf(sessions):
+    """
+    Groups manifest sessions that were recorded into the same EDF file, keeping manifest order.
+
+    Returns:
+    list: One list of (manifestIndex, session) tuples per EDF file.
+    """
+    groups = {}
+    for index, session in enumerate(sessions):
+        groups.setdefault(session['edfPath'], []).append((index, session))
+    return list(groups.values())
+
+def estimateGroupMemoryGb(group):
+    """
+    Rough peak memory of one EDF group: the EDF once as float64 plus the decoded XDF audio of one session.
+    """
+    edfPath = group[0][1]['edfPath']
+    edfBytes = os.path.getsize(edfPath) if os.path.exists(edfPath) else 0
+    xdfBytes = max(
+        os.path.getsize(session['xdfPath']) if os.path.exists(session['xdfPath']) else 0
+        for _, session in group
+    )
+    return (4 * edfBytes + 2 * xdfBytes) / 1024 ** 3
+
+def processSession(session):
+    """
+    Runs EegDataProcessor -> AudioDataProcessor -> EegAudioDataProcessor export for one session.
+
+    The EDF is taken from the per-process shared cache and narrowed to the session's audio time
+    span (plus config.sessionWindowMargin) with windowView. Exceptions are caught and reported
+    in the returned summary row so that one broken session does not stop the batch. With
+    config.useCheckpoints the session runs as a SessionPipeline instead, which skips the stages
+    whose inputs and config did not change since the last run.
+
+    Parameters:
+    session (dict): One manifest row.
+
+    Returns:
+    dict: Summary row with the summaryColumns keys.
+    """
+    summary = {column: session.get(column) for column in summaryColumns}
+    startTime = time.time()
+    try:
+        print(f"Subject ID| {session['subjectId']} Session Id:  {session['sessionId']}, {session['xdfPath']}, {session['edfPath']}")
+        if config.useCheckpoints:
+            result = SessionPipeline(session).run()
+            summary.update({'status': 'success', 'nTrials': result['nTrials'], 'error': ''})
+            summary['seconds'] = round(time.time() - startTime, 1)
+            return summary
+
+        eegData = loadSharedEegData(session['edfPath'], triggerOnly=True)
+        audioData = AudioDataProcessor(session['xdfPath'])
+        if config.autoTimeDifference:
+            audioData.detectTimeDifference(eegData)
+        eegData = eegData.windowView(
+            audioData.audioStartTime - config.sessionWindowMargin,
+            audioData.audioEndTime + config.sessionWindowMargin
+        )
+
+        eegAudioData = EegAudioDataProcessor(
+            eegData=eegData,
+            audioData=audioData,
+            taskName=session['taskName'],
+            subjectID=session['subjectId'],
+            sessionID=session['sessionId'],
+            runID=session['runId']
+        )
+        summary.update({'status': 'success', 'nTrials': eegAudioData.nTrials, 'error': ''})
+    except Exception:
+        summary.update({'status': 'failed', 'nTrials': 0, 'error': traceback.format_exc().strip().splitlines()[-1]})
+        traceback.print_exc()
+    summary['seconds'] = round(time.time() - startTime, 1)
+    return summary
+
+def processSessionGroup(group):
+    """
+    Processes every session of one EDF group in order, loading the EDF only once.
+
+    Parameters:
+    group (list): (manifestIndex, session) tuples sharing one EDF, see groupSessionsByEdf.
+
+    Returns:
+    list: (manifestIndex, summary) tuples.
+    """
+    results = [(index, processSession(session)) for index, session in group]
+    releaseSharedEegData(group[0][1]['edfPath'])
+    return results
+
+def writeBatchSummary(summaries, summaryPath):
+    """Write one row per session with its status, duration, trial count and error."""
+    with open(summaryPath, 'w', newline='', encoding='utf-8') as summaryFile:
+        writer = csv.DictWriter(summaryFile, fieldnames=summaryColumns, delimiter='\t')
+        writer.writeheader()
+        writer.writerows(summaries)
+    return summaryPath
+
+def runBatch(manifestPath, numWorkers=config.numWorkers, memoryLimitGb=config.batchMemoryLimitGb):
+    """
+    Converts every session of a manifest to BIDS in a process pool.
+
+    Sessions that share an EDF file run together in one worker so the recording is loaded and
+    decoded once. A group is only started while the estimated memory of all running groups stays
+    under memoryLimitGb (at least one group always runs), so large recordings are not loaded
+    side by side. Workers serialize their write_raw_bids calls with bidsRootLock, since each one
+    rewrites the dataset-level participants.tsv and dataset_description.json. A per-session
+    summary is written to config.bidsDir / 'batch_summary.tsv'.
+
+    Parameters:
+    manifestPath (str or Path): CSV/TSV/JSON manifest, see loadManifest.
+    numWorkers (int): Maximum number of worker processes.
+    memoryLimitGb (float): Memory budget for concurrently running sessions.
+
+    Returns:
+    list: The summary rows, in manifest order.
+    """
+    print('***************************Running BIDS batch conversion***************************')
+    sessions = loadManifest(manifestPath)
+    groups = groupSessionsByEdf(sessions)
+    pending = [(group, estimateGroupMemoryGb(group)) for group in groups]
+    summaries = [None] * len(sessions)
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=max(1, min(numWorkers, len(groups)))) as executor:
+        while pending or running:
+            usedMemory = sum(running.values())
+            while pending and len(running) < numWorkers:
+                group, memory = pending[0]
+                if running and usedMemory + memory > memoryLimitGb:
+                    break
+                pending.pop(0)
+                running[executor.submit(processSessionGroup, group)] = memory
+                usedMemory += memory
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                running.pop(future)
+                for index, summary in future.result():
+                    summaries[index] = summary
+                    print(f"{summary['subjectId']}/{summary['sessionId']}: {summary['status']}")
+
+    summaryPath = writeBatchSummary(summaries, Path(config.bidsDir, 'batch_summary.tsv'))
+    nFailed = sum(summary['status'] != 'success' for summary in summaries)
+    print(f'*******************Batch finished: {len(summaries) - nFailed} succeeded, {nFailed} failed, summary in {summaryPath}*******************')
+    return summaries
@@ -0,0 +1,49 @@
+import os
+import time
+from pathlib import Path
+from contextlib import contextmanager
+
+import src.config as config
+import pdb
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+lockFileName = '.bids.lock'
+
+@contextmanager
+def bidsRootLock(bidsDir=config.bidsDir):
+    """
+    Holds an exclusive lock on the BIDS root across processes.
+
+    write_raw_bids rewrites the root-level participants.tsv and dataset_description.json and the
+    session's scans.tsv on every call, so concurrent batch workers must not run it side by side.
+    The lock is taken on <bidsDir>/.bids.lock and released by the operating system if the
+    process holding it dies, so a crashed worker never blocks the others.
+
+    Parameters:
+    bidsDir (str or Path): Root of the BIDS tree.
+    """
+    os.makedirs(bidsDir, exist_ok=True)
+    with open(Path(bidsDir, lockFileName), 'a+') as lockFile:
+        if fcntl is not None:
+            fcntl.flock(lockFile, fcntl.LOCK_EX)
+        else:
+            lockFile.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lockFile.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lockFile, fcntl.LOCK_UN)
+            else:
+                lockFile.seek(0)
+                msvcrt.locking(lockFile.fileno(), msvcrt.LK_UNLCK, 1)
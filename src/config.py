@@ -4,6 +4,8 @@ from pathlib import Path
 currDir = os.getcwd()
 bidsDir = Path(currDir, 'BIDS_1')
 numWorkers = 20
+batchMemoryLimitGb = 16
+manifestPath = Path(currDir, 'manifest.tsv')
 
 use_gui = True
 windowIconPath = str(Path(currDir, 'src', 'gui','Images', 'icon.bmp'))
@@ -12,9 +14,43 @@ bidsEventsHeader = [
     'onset', 'duration', 'eegOnsetIndex', 
     'audioOnset', 'audioDuration', 'audioOnsetIndex',
     'eegOnsetUnixTime', 'audioOnsetUnixTime',
+    'correctedEegOnsetIndex', 'correctedAudioOnsetIndex',
     'block', 'trialType', 'word'
 ]
 timeDifference = 0
+autoTimeDifference = True
+edfReaderMode = 'preload' # 'preload' or 'memmap'
+xdfMarkerStreamQuery = [{'type': 'Markers'}]
+xdfAudioStreamQuery = [{'type': 'Audio'}]
+syncAnchor = 'eventTrain' # 'eventTrain' or 'closest'
+syncBinSize = 0.1
+syncAligner = 'greedy' # 'greedy' or 'banded'
+syncBand = 50
+sessionWindowMargin = 30
+cropEegToSession = True
+eegExportCropMargin = 5.0
+streamEegExport = True
+eegExportChunkRecords = 60
+exportTempDir = None # None uses the system temporary directory
+audioExportFormat = 'wav' # 'wav' or 'flac'
+audioExportDtype = 'native' # 'native', 'int16', 'int32' or 'float32'
+audioExportChunkFrames = 262144
+cropAudioToSession = False
+audioExportCropMargin = 5.0
+useCheckpoints = True
+checkpointDir = Path(currDir, 'checkpoints')
+useParseCache = True
+parseCacheDir = Path(currDir, 'cache')
+parseCacheMaxGb = 20
 removeChannel147 = True
+epochWindow = (-0.2, 1.0)
+epochChunkTrials = 64
+datasetDir = Path(currDir, 'dataset')
+datasetTrialsPerShard = 1000
+datasetValidationFraction = 0.2
+datasetSeed = 0
+writeDerivativeStore = False
+derivativeBackend = 'hdf5' # 'hdf5' (needs h5py) or 'zarr' (needs zarr)
 analyseAudio = False
+clipDuration = 1.5
 os.makedirs(bidsDir, exist_ok=True)
@@ -0,0 +1,213 @@
+import io
+import csv
+import json
+import tarfile
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import soundfile as sf
+from scipy.io import wavfile
+import src.config as config
+from src.edf_reader import EdfReader
+from src.trial_windows import epochGeometry, readEpoch, readAudioWindow
+import pdb
+
+datasetIndexColumns = [
+    'split', 'shard', 'key', 'subjectId', 'sessionId', 'trial', 'block', 'trialType', 'word',
+    'eegOffset', 'audioOffset', 'labelOffset'
+]
+nonEegChannels = ('TRIG', 'EDF Annotations')
+
+def findBidsTrials(bidsDir=config.bidsDir, blocks=None, trialTypes=('StartSaying',)):
+    """
+    Lists the trials of every session in a BIDS tree from its events TSV files.
+
+    Each events TSV under sub-*/ses-*/audio is paired with the session's audio file and with the
+    EDF in the session's eeg folder (the one with the same name prefix, or the only one). Audio
+    windows start at the drift-corrected correctedAudioOnsetIndex when the TSV has it.
+
+    Parameters:
+    bidsDir (str or Path): Root of the BIDS tree.
+    blocks (iterable): Blocks to keep ('Overt', 'Inert'), None keeps every block.
+    trialTypes (iterable): Trial types to keep, None keeps every trial type.
+
+    Returns:
+    list: One dict per trial with the session ids, file paths, onsets and labels.
+    """
+    trials = []
+    for eventsPath in sorted(Path(bidsDir).glob('sub-*/ses-*/audio/*_events.tsv')):
+        prefix = eventsPath.name[:-len('_events.tsv')]
+        audioPaths = [eventsPath.with_name(f'{prefix}_audio{suffix}') for suffix in ('.wav', '.flac')]
+        audioPaths = [path for path in audioPaths if path.exists()]
+        edfPaths = sorted(eventsPath.parent.parent.glob('eeg/*_eeg.edf'))
+        edfPaths = [path for path in edfPaths if path.name.startswith(prefix)] or edfPaths
+        if not audioPaths or len(edfPaths) != 1:
+            print(f'Skipping {eventsPath}: expected one audio and one EDF file')
+            continue
+
+        with open(eventsPath, newline='', encoding='utf-8') as tsvFile:
+            rows = list(csv.DictReader(tsvFile, delimiter='\t'))
+        selected = np.ones(len(rows), dtype=bool)
+        if blocks is not None:
+            selected &= np.isin([row['block'] for row in rows], list(blocks))
+        if trialTypes is not None:
+            selected &= np.isin([row['trialType'] for row in rows], list(trialTypes))
+
+        for trial in np.flatnonzero(selected):
+            row = rows[trial]
+            trials.append({
+                'subjectId': eventsPath.parts[-4], 'sessionId': eventsPath.parts[-3], 'trial': int(trial),
+                'edfPath': str(edfPaths[0]), 'audioPath': str(audioPaths[0]),
+                'eegOnsetIndex': int(float(row['eegOnsetIndex'])),
+                'audioOnsetIndex': int(float(row.get('correctedAudioOnsetIndex') or row['audioOnsetIndex'])),
+                'block': row['block'], 'trialType': row['trialType'], 'word': row['word']
+            })
+    return trials
+
+def splitBySubject(trials, validationSubjects=None, validationFraction=config.datasetValidationFraction, seed=config.datasetSeed):
+    """
+    Splits trials into train and validation sets by subject and shuffles each set deterministically.
+
+    Parameters:
+    trials (list): Trials from findBidsTrials.
+    validationSubjects (iterable): Subjects of the validation set. When None, round(validationFraction
+        x nSubjects) subjects are drawn with seed.
+    validationFraction (float): Share of subjects used for validation when validationSubjects is None.
+    seed (int): Seed of the subject draw and of the shuffles.
+
+    Returns:
+    dict: {'train': trials, 'validation': trials}.
+    """
+    rng = np.random.default_rng(seed)
+    subjects = sorted({trial['subjectId'] for trial in trials})
+    if validationSubjects is None:
+        nValidation = int(round(validationFraction * len(subjects)))
+        validationSubjects = rng.permutation(subjects)[:nValidation].tolist() if nValidation else []
+    validationSubjects = set(validationSubjects)
+
+    splits = {}
+    for split, inValidation in (('train', False), ('validation', True)):
+        splitTrials = [trial for trial in trials if (trial['subjectId'] in validationSubjects) == inValidation]
+        splits[split] = [splitTrials[index] for index in rng.permutation(len(splitTrials))]
+    return splits
+
+openedRecordings = {}
+
+def openRecording(path):
+    """Open an EDF reader or audio file once per worker process."""
+    if path not in openedRecordings:
+        if path.endswith('.edf'):
+            openedRecordings[path] = EdfReader(path)
+        elif path.endswith('.wav'):
+            openedRecordings[path] = wavfile.read(path, mmap=True)
+        else:
+            openedRecordings[path] = sf.SoundFile(path)
+    return openedRecordings[path]
+
+def readTrialAudio(path, start, nSamples):
+    """Read a zero-padded audio window from a memory-mapped WAV or by seeking in a FLAC file."""
+    recording = openRecording(path)
+    if isinstance(recording, tuple):
+        return readAudioWindow(recording[1], start, nSamples)
+    dtype = 'int16' if recording.subtype in ('PCM_16', 'PCM_S8') else 'int32'
+    window = np.zeros((nSamples, recording.channels), dtype=dtype)
+    if start + nSamples > 0 and start < recording.frames:
+        recording.seek(max(0, start))
+        block = recording.read(nSamples - max(0, -start), dtype=dtype, always_2d=True)
+        window[max(0, -start):max(0, -start) + block.shape[0]] = block
+    return window
+
+def addTarMember(shardFile, name, data):
+    """Append one member to an open tar file and return the offset of its data in the shard."""
+    member = tarfile.TarInfo(name)
+    member.size = len(data)
+    shardFile.addfile(member, io.BytesIO(data))
+    return shardFile.offset - -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+def npyBytes(array):
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    return buffer.getvalue()
+
+def writeShard(shardPath, split, trials, window, channels):
+    """
+    Packs trials into one tar shard as '<key>.eeg.npy', '<key>.audio.npy' and '<key>.json' members.
+
+    Returns:
+    list: Index rows of the packed trials with the data offset of every member.
+    """
+    rows = []
+    with tarfile.open(shardPath, 'w') as shardFile:
+        for trial in trials:
+            reader = openRecording(trial['edfPath'])
+            trialChannels = [name for name in reader.channelNames if name not in nonEegChannels] if channels is None else channels
+            channelIndexes = [reader.channelIndex(channel) for channel in trialChannels]
+            eegStartOffset, eegSamples = epochGeometry(reader.samplingFrequencies[channelIndexes[0]], window)
+            audio = openRecording(trial['audioPath'])
+            audioRate = audio[0] if isinstance(audio, tuple) else audio.samplerate
+            audioStartOffset, audioSamples = epochGeometry(audioRate, window)
+
+            key = f"{trial['subjectId']}_{trial['sessionId']}_trial-{trial['trial']:04d}"
+            label = {column: trial[column] for column in ('subjectId', 'sessionId', 'trial', 'block', 'trialType', 'word')}
+            label.update({'channels': trialChannels, 'audioSamplingFrequency': audioRate, 'window': list(window)})
+            rows.append({
+                'split': split, 'shard': Path(shardPath).name, 'key': key,
+                **{column: trial[column] for column in ('subjectId', 'sessionId', 'trial', 'block', 'trialType', 'word')},
+                'eegOffset': addTarMember(shardFile, f'{key}.eeg.npy', npyBytes(readEpoch(
+                    reader, channelIndexes, trial['eegOnsetIndex'] + eegStartOffset, eegSamples
+                ))),
+                'audioOffset': addTarMember(shardFile, f'{key}.audio.npy', npyBytes(readTrialAudio(
+                    trial['audioPath'], trial['audioOnsetIndex'] + audioStartOffset, audioSamples
+                ))),
+                'labelOffset': addTarMember(shardFile, f'{key}.json', json.dumps(label).encode('utf-8')),
+            })
+    return rows
+
+def exportShardedDataset(bidsDir=config.bidsDir, destinationDir=config.datasetDir, trialsPerShard=config.datasetTrialsPerShard,
+                         window=config.epochWindow, channels=None, blocks=None, trialTypes=('StartSaying',),
+                         validationSubjects=None, validationFraction=config.datasetValidationFraction,
+                         seed=config.datasetSeed, numWorkers=config.numWorkers):
+    """
+    Exports every selected trial of a BIDS tree as paired EEG windows, audio clips and labels in tar shards.
+
+    Trials are split by subject into train and validation sets, shuffled with seed, and packed
+    trialsPerShard at a time into '<split>-<n>.tar' shards written in a process pool. Each trial is
+    stored as consecutive '<key>.eeg.npy', '<key>.audio.npy' and '<key>.json' members, so shards can
+    be streamed sequentially (the layout WebDataset-style loaders expect). index.tsv lists every
+    trial with its shard and the byte offsets of its members for random access.
+
+    Parameters:
+    bidsDir (str or Path): Root of the BIDS tree.
+    destinationDir (str or Path): Directory receiving the shards and index.tsv.
+    trialsPerShard (int): Trials per shard.
+    window (tuple): (tmin, tmax) in seconds around the EEG and audio onsets.
+    channels (list): EEG channel names, defaults to every signal except the trigger and annotations.
+    blocks, trialTypes: Trial selection, see findBidsTrials.
+    validationSubjects, validationFraction, seed: Split and shuffle, see splitBySubject.
+    numWorkers (int): Maximum number of worker processes.
+
+    Returns:
+    Path: The index file.
+    """
+    destinationDir = Path(destinationDir)
+    destinationDir.mkdir(parents=True, exist_ok=True)
+    splits = splitBySubject(findBidsTrials(bidsDir, blocks, trialTypes), validationSubjects, validationFraction, seed)
+
+    shards = []
+    for split, trials in splits.items():
+        for shardNumber, first in enumerate(range(0, len(trials), trialsPerShard)):
+            shards.append((destinationDir / f'{split}-{shardNumber:05d}.tar', split, trials[first:first + trialsPerShard]))
+    print(f"*******************Packing {sum(len(trials) for trials in splits.values())} trials into {len(shards)} shards*******************")
+
+    with ProcessPoolExecutor(max_workers=max(1, min(numWorkers, len(shards)))) as executor:
+        futures = [executor.submit(writeShard, shardPath, split, trials, window, channels) for shardPath, split, trials in shards]
+        rows = [row for future in futures for row in future.result()]
+
+    indexPath = destinationDir / 'index.tsv'
+    with open(indexPath, 'w', newline='', encoding='utf-8') as indexFile:
+        writer = csv.DictWriter(indexFile, fieldnames=datasetIndexColumns, delimiter='\t')
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f'*******************Dataset written to {destinationDir}*******************')
+    return indexPath
@@ -0,0 +1,113 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import src.config as config
+from src.trial_windows import selectTrials, epochGeometry, readEpoch, readAudioWindow
+import pdb
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+try:
+    import zarr
+except ImportError:
+    zarr = None
+
+derivativeExtensions = {'hdf5': '.h5', 'zarr': '.zarr'}
+
+def requireBackend(backend):
+    """Raise an ImportError naming the missing package when a derivative backend is not installed."""
+    if backend == 'hdf5' and h5py is None:
+        raise ImportError('The hdf5 derivative store needs h5py: pip install h5py')
+    if backend == 'zarr' and zarr is None:
+        raise ImportError('The zarr derivative store needs zarr: pip install zarr')
+    if backend not in derivativeExtensions:
+        raise ValueError(f'Unknown derivative backend {backend}, expected one of {list(derivativeExtensions)}')
+
+def createTrialArray(store, backend, name, shape, dtype):
+    """Create a compressed array with exactly one trial per chunk."""
+    chunks = (1,) + tuple(shape[1:])
+    if backend == 'hdf5':
+        return store.create_dataset(name, shape=shape, dtype=dtype, chunks=chunks, compression='gzip', compression_opts=4, shuffle=True)
+    return store.create_dataset(name, shape=shape, dtype=dtype, chunks=chunks)
+
+def writeDerivativeStore(eegAudioData, destinationPath, backend=config.derivativeBackend, window=config.epochWindow, channels=None, blocks=None, trialTypes=('StartSaying',)):
+    """
+    Writes a session's trials as trial-aligned, chunked and compressed EEG and audio arrays.
+
+    The store holds 'eeg' (trials x channels x samples, in Volts) and 'audio' (trials x frames x
+    audioChannels) arrays whose chunks are exactly one trial, so a trial's EEG and audio are two
+    chunk reads. The synchronized event row of every trial is stored as a JSON byte string in an
+    'events' array next to them, and only the channel names, sampling rates and window are stored
+    as attributes (HDF5 caps attributes at 64KB). Both windows span window seconds around the trial's EEG onset
+    and its drift-corrected audio onset (correctedAudioOnsetIndex) and are padded where they run past a recording.
+
+    Parameters:
+    eegAudioData (EegAudioDataProcessor): A synchronized session with its audio loaded.
+    destinationPath (str or Path): The .h5 file or .zarr directory to create.
+    backend (str): 'hdf5' (needs h5py) or 'zarr' (needs zarr).
+    window (tuple): (tmin, tmax) in seconds relative to the onsets.
+    channels (list): Channel names, defaults to the channels exported to BIDS.
+    blocks (iterable): Blocks to keep, None keeps every block.
+    trialTypes (iterable): Trial types to keep, None keeps every trial type (including ITI and
+        Fixation events).
+
+    Returns:
+    Path: destinationPath.
+    """
+    requireBackend(backend)
+    channels = eegAudioData.selectExportChannels() if channels is None else list(channels)
+    events = eegAudioData.synchronizedEvents
+    trials = selectTrials(events, blocks, trialTypes)
+
+    reader = eegAudioData.eegData.getEdfReader()
+    channelIndexes = eegAudioData.eegData.edfChannelIndexes(channels)
+    eegStartOffset, eegSamples = epochGeometry(eegAudioData.eegData.samplingFrequency, window)
+    audio = eegAudioData.audioData.audio
+    audio = audio.reshape(audio.shape[0], -1)
+    audioStartOffset, audioSamples = epochGeometry(eegAudioData.audioSampleRate, window)
+
+    attributes = {
+        'channels': json.dumps(channels),
+        'eegSamplingFrequency': float(eegAudioData.eegData.samplingFrequency),
+        'audioSamplingFrequency': float(eegAudioData.audioSampleRate),
+        'window': json.dumps(list(window)),
+    }
+    trialEvents = np.array([json.dumps(events.row(trial)).encode('utf-8') for trial in trials], dtype=np.bytes_)
+
+    store = h5py.File(destinationPath, 'w') if backend == 'hdf5' else zarr.open_group(str(destinationPath), mode='w')
+    try:
+        eegArray = createTrialArray(store, backend, 'eeg', (len(trials), len(channels), eegSamples), np.float32)
+        audioArray = createTrialArray(store, backend, 'audio', (len(trials), audioSamples, audio.shape[1]), audio.dtype)
+        store.create_dataset('events', data=trialEvents)
+        eegOnsetIndexes = events.data['eegOnsetIndex'][trials]
+        audioOnsetIndexes = events.data['correctedAudioOnsetIndex'][trials]
+        for position in range(len(trials)):
+            eegArray[position] = readEpoch(reader, channelIndexes, int(eegOnsetIndexes[position]) + eegStartOffset, eegSamples)
+            audioArray[position] = readAudioWindow(audio, int(audioOnsetIndexes[position]) + audioStartOffset, audioSamples)
+        store.attrs.update(attributes)
+    finally:
+        if backend == 'hdf5':
+            store.close()
+
+    return destinationPath
+
+def openDerivativeStore(path):
+    """Open a derivative store read-only, picking the backend from its extension."""
+    if Path(path).suffix == derivativeExtensions['hdf5']:
+        requireBackend('hdf5')
+        return h5py.File(path, 'r')
+    requireBackend('zarr')
+    return zarr.open_group(str(path), mode='r')
+
+def readDerivativeTrial(store, trial):
+    """
+    Fetch one trial from an open derivative store.
+
+    Returns:
+    tuple: (eeg (channels x samples), audio (frames x audioChannels), event dict).
+    """
+    return store['eeg'][trial], store['audio'][trial], json.loads(store['events'][trial])
@@ -0,0 +1,197 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pdb
+
+unitScalings = {'uV': 1e-6, 'µV': 1e-6, 'mV': 1e-3, 'nV': 1e-9, 'V': 1.0}
+
+class EdfReader:
+    def __init__(self, filepath):
+        """
+        Memory-mapped reader for 16-bit EDF/EDF+ files.
+
+        Only the header is parsed eagerly. The data records are exposed through an np.memmap
+        so that a channel or a time range of a channel can be read and scaled on demand
+        without loading the rest of the recording.
+
+        Parameters:
+        filepath (str): The filepath to the EDF file.
+        """
+        self.filepath = filepath
+        self.readHeader()
+        self.mapDataRecords()
+
+    def readHeader(self):
+        print(f'*******************Reading EDF header {self.filepath}*******************')
+        with open(self.filepath, 'rb') as edfFile:
+            fixedHeader = edfFile.read(256).decode('latin-1')
+            self.nSignals = int(fixedHeader[252:256])
+            signalHeader = edfFile.read(256 * self.nSignals).decode('latin-1')
+
+        self.patientId = fixedHeader[8:88].strip()
+        self.recordingId = fixedHeader[88:168].strip()
+        self.headerBytes = int(fixedHeader[184:192])
+        self.nRecords = int(fixedHeader[236:244])
+        self.recordDurationField = fixedHeader[244:252].strip()
+        self.recordDuration = float(self.recordDurationField)
+        self.startTime = self.parseStartTime(fixedHeader[168:176], fixedHeader[176:184])
+
+        self.signalFieldWidths = fields = [
+            ('labels', 16), ('transducers', 80), ('physicalDimensions', 8),
+            ('physicalMin', 8), ('physicalMax', 8), ('digitalMin', 8), ('digitalMax', 8),
+            ('prefilters', 80), ('samplesPerRecord', 8), ('reserved', 32)
+        ]
+        offset = 0
+        signalFields = {}
+        for name, width in fields:
+            values = []
+            for _ in range(self.nSignals):
+                values.append(signalHeader[offset:offset + width].strip())
+                offset += width
+            signalFields[name] = values
+        self.signalFields = signalFields
+
+        self.channelNames = signalFields['labels']
+        self.physicalDimensions = signalFields['physicalDimensions']
+        self.samplesPerRecord = np.array(signalFields['samplesPerRecord'], dtype=np.int64)
+        physicalMin = np.array(signalFields['physicalMin'], dtype=np.float64)
+        physicalMax = np.array(signalFields['physicalMax'], dtype=np.float64)
+        digitalMin = np.array(signalFields['digitalMin'], dtype=np.float64)
+        digitalMax = np.array(signalFields['digitalMax'], dtype=np.float64)
+
+        unitScale = np.array(
+            [unitScalings.get(unit, 1.0) for unit in self.physicalDimensions], dtype=np.float64
+        )
+        self.gains = (physicalMax - physicalMin) / (digitalMax - digitalMin) * unitScale
+        self.offsets = (physicalMin - digitalMin * (physicalMax - physicalMin) / (digitalMax - digitalMin)) * unitScale
+        self.samplingFrequencies = self.samplesPerRecord / self.recordDuration
+        self.recordOffsets = np.concatenate(([0], np.cumsum(self.samplesPerRecord)))
+        self.recordLength = int(self.recordOffsets[-1])
+
+    def parseStartTime(self, startDate, startTime):
+        day, month, year = [int(value) for value in startDate.split('.')]
+        hour, minute, second = [int(value) for value in startTime.split('.')]
+        year += 1900 if year >= 85 else 2000
+        return datetime(year, month, day, hour, minute, second, tzinfo=timezone.utc)
+
+    def mapDataRecords(self):
+        nRecords = self.nRecords
+        if nRecords < 0:
+            fileBytes = np.memmap(self.filepath, dtype=np.uint8, mode='r').shape[0]
+            nRecords = (fileBytes - self.headerBytes) // (2 * self.recordLength)
+            self.nRecords = nRecords
+
+        self.records = np.memmap(
+            self.filepath, dtype='<i2', mode='r', offset=self.headerBytes,
+            shape=(nRecords, self.recordLength)
+        )
+
+    def channelIndex(self, channel):
+        """
+        Resolves a channel name or index to its position in the EDF signal list.
+
+        Parameters:
+        channel (str or int): Channel label or index.
+
+        Returns:
+        int: Index of the channel.
+        """
+        if isinstance(channel, str):
+            return self.channelNames.index(channel)
+        return int(channel)
+
+    def channelView(self, channel):
+        """
+        Returns the raw digital samples of one channel as a strided (nRecords, samplesPerRecord) view.
+
+        Parameters:
+        channel (str or int): Channel label or index.
+
+        Returns:
+        np.ndarray: Read-only view into the memory-mapped data records.
+        """
+        index = self.channelIndex(channel)
+        return self.records[:, self.recordOffsets[index]:self.recordOffsets[index + 1]]
+
+    def getChannelData(self, channel, start=0, stop=None):
+        """
+        Reads and scales samples [start, stop) of one channel to physical units (Volts for EEG).
+
+        Only the data records overlapping the requested range are touched, so reading the
+        trigger channel or a short window does not page in the rest of the file.
+
+        Parameters:
+        channel (str or int): Channel label or index.
+        start (int): First sample index.
+        stop (int): Sample index after the last sample, defaults to the end of the recording.
+
+        Returns:
+        np.ndarray: float64 array with the scaled samples.
+        """
+        index = self.channelIndex(channel)
+        samplesPerRecord = int(self.samplesPerRecord[index])
+        nSamples = samplesPerRecord * self.nRecords
+        stop = nSamples if stop is None else min(stop, nSamples)
+        start = max(start, 0)
+        if stop <= start:
+            return np.empty(0, dtype=np.float64)
+
+        firstRecord = start // samplesPerRecord
+        lastRecord = (stop - 1) // samplesPerRecord + 1
+        view = self.channelView(index)[firstRecord:lastRecord].reshape(-1)
+        view = view[start - firstRecord * samplesPerRecord:stop - firstRecord * samplesPerRecord]
+
+        return view * self.gains[index] + self.offsets[index]
+
+    def getData(self, channels=None, start=0, stop=None):
+        """
+        Reads several channels over the same sample range into a (nChannels, nSamples) array.
+
+        Parameters:
+        channels (list): Channel labels or indexes, defaults to every channel.
+        start (int): First sample index.
+        stop (int): Sample index after the last sample.
+
+        Returns:
+        np.ndarray: float64 array with one row per channel.
+        """
+        if channels is None:
+            channels = list(range(self.nSignals))
+        return np.vstack([self.getChannelData(channel, start, stop) for channel in channels])
+
+    def getSampleBlock(self, channels, start=0, stop=None):
+        """
+        Reads samples [start, stop) of several channels with one slice of the data records.
+
+        Unlike getData, which slices the memory map once per channel, the covering records are
+        read once and the channels are gathered from them, which is much cheaper for the many
+        short windows of an epoching job. Channels with different samples per record fall back
+        to getData.
+
+        Parameters:
+        channels (list): Channel labels or indexes sharing one sampling frequency.
+        start (int): First sample index.
+        stop (int): Sample index after the last sample.
+
+        Returns:
+        np.ndarray: float64 array of shape (nChannels, nSamples).
+        """
+        indexes = np.array([self.channelIndex(channel) for channel in channels], dtype=np.int64)
+        samplesPerRecord = self.samplesPerRecord[indexes]
+        if np.any(samplesPerRecord != samplesPerRecord[0]):
+            return self.getData(indexes, start, stop)
+
+        samplesPerRecord = int(samplesPerRecord[0])
+        nSamples = samplesPerRecord * self.nRecords
+        stop = nSamples if stop is None else min(stop, nSamples)
+        start = max(start, 0)
+        if stop <= start:
+            return np.empty((indexes.shape[0], 0), dtype=np.float64)
+
+        firstRecord = start // samplesPerRecord
+        lastRecord = (stop - 1) // samplesPerRecord + 1
+        columns = self.recordOffsets[indexes][:, None] + np.arange(samplesPerRecord)
+        block = self.records[firstRecord:lastRecord][:, columns].transpose(1, 0, 2).reshape(indexes.shape[0], -1)
+        block = block[:, start - firstRecord * samplesPerRecord:stop - firstRecord * samplesPerRecord]
+
+        return block * self.gains[indexes][:, None] + self.offsets[indexes][:, None]
@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+import numpy as np
+import pdb
+
+def formatEdfField(value, width):
+    """Left-justify a header value into a fixed-width ASCII EDF field."""
+    text = str(value)
+    if isinstance(value, float):
+        text = f'{value:.8g}'
+    return text[:width].ljust(width)
+
+def writeEdfHeader(edfFile, reader, channelIndexes, nRecords, startTime):
+    """
+    Writes the EDF header for a subset of the reader's signals.
+
+    Parameters:
+    edfFile (file): File opened in binary mode, positioned at 0.
+    reader (EdfReader): Source recording.
+    channelIndexes (list): Signal indexes of the source to keep.
+    nRecords (int): Number of data records that will follow.
+    startTime (datetime): Start of the first written record.
+    """
+    nSignals = len(channelIndexes)
+    header = ''.join([
+        formatEdfField('0', 8),
+        formatEdfField(reader.patientId, 80),
+        formatEdfField(reader.recordingId, 80),
+        startTime.strftime('%d.%m.%y'),
+        startTime.strftime('%H.%M.%S'),
+        formatEdfField(256 * (nSignals + 1), 8),
+        formatEdfField('', 44),
+        formatEdfField(nRecords, 8),
+        formatEdfField(reader.recordDurationField, 8),
+        formatEdfField(nSignals, 4),
+    ])
+    for fieldName, width in reader.signalFieldWidths:
+        values = reader.signalFields[fieldName]
+        header += ''.join(formatEdfField(values[index], width) for index in channelIndexes)
+    edfFile.write(header.encode('latin-1'))
+
+def writeEdfInChunks(reader, destinationPath, channelIndexes, startRecord=0, stopRecord=None, chunkRecords=60):
+    """
+    Streams selected signals and data records of an EDF recording into a new EDF file.
+
+    The digital samples are copied record block by record block straight from the reader's
+    memory map, without scaling to float or building an MNE object, so peak memory is one chunk
+    of chunkRecords records whatever the length of the recording.
+
+    Parameters:
+    reader (EdfReader): Source recording.
+    destinationPath (str or Path): EDF file to create.
+    channelIndexes (list): Signal indexes of the source to keep, in output order.
+    startRecord (int): First data record to copy.
+    stopRecord (int): Data record after the last one to copy, defaults to the end.
+    chunkRecords (int): Number of data records copied per chunk.
+
+    Returns:
+    Path: destinationPath.
+    """
+    stopRecord = reader.nRecords if stopRecord is None else min(stopRecord, reader.nRecords)
+    columns = np.concatenate([
+        np.arange(reader.recordOffsets[index], reader.recordOffsets[index + 1]) for index in channelIndexes
+    ])
+    startTime = reader.startTime + timedelta(seconds=startRecord * reader.recordDuration)
+
+    with open(destinationPath, 'wb') as edfFile:
+        writeEdfHeader(edfFile, reader, channelIndexes, stopRecord - startRecord, startTime)
+        for chunkStart in range(startRecord, stopRecord, chunkRecords):
+            chunkStop = min(chunkStart + chunkRecords, stopRecord)
+            chunk = reader.records[chunkStart:chunkStop][:, columns]
+            edfFile.write(np.ascontiguousarray(chunk, dtype='<i2').tobytes())
+
+    return destinationPath
@@ -1,20 +1,58 @@
 import os
 import csv
+import time
+import shutil
+import tempfile
 import pdb
 from pathlib import Path
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
 
 
 import mne
 import numpy as np
-from scipy.io.wavfile import write
 
 import src.config as config
 from src.utils import findClosestStartingIndex
+from src.event_sync import matchEventsByType, splitAudioEventName, findEventTrainLag
+from src.event_sync import fitClockDrift, alignEventsBanded
+from src.edf_writer import writeEdfInChunks
+from src.wav_writer import nativeAudioDtype
+from src.flac_writer import audioWriters
+from src.derivative_store import writeDerivativeStore, derivativeExtensions
+from src.event_table import EventTable, synchronizedEventColumns
+from src.bids_lock import bidsRootLock
 from mne_bids import BIDSPath, write_raw_bids
 
+bidsWriters = ('eeg', 'audio', 'events', 'derivatives')
+synchronizationAttributes = [
+    'eventTrainLag', 'matchedEventIndexes', 'synchronizedEvents', 'nTrials', 'clockDrift',
+    'effectiveAudioSampleRate',
+    'eegCropStartIndex', 'eegCropStopIndex', 'audioCropStartIndex', 'audioCropStopIndex'
+]
+
+def enabledBidsWriters():
+    """The writers exportBidsFiles runs by default; the derivative store only with config.writeDerivativeStore."""
+    return tuple(writer for writer in bidsWriters if writer != 'derivatives' or config.writeDerivativeStore)
+
+def bidsOutputPaths(subjectID, sessionID, runID, taskName):
+    """Paths of the files every writer of EegAudioDataProcessor produces for a session."""
+    destinationDir = Path(f'{config.bidsDir}/sub-{subjectID}/ses-{sessionID}')
+    fileName = f'sub-{subjectID}_ses-{sessionID}_task-{taskName}_run-{runID}'
+    return {
+        'eeg': destinationDir / 'eeg' / f'sub-{subjectID}_ses-{sessionID}_task-VCV_run-01_eeg.edf',
+        'audio': destinationDir / 'audio' / f'{fileName}_audio.{config.audioExportFormat}',
+        'events': destinationDir / 'audio' / f'{fileName}_events.tsv',
+        'derivatives': Path(
+            config.bidsDir, 'derivatives', 'trials', f'sub-{subjectID}', f'ses-{sessionID}',
+            f'{fileName}_trials{derivativeExtensions[config.derivativeBackend]}'
+        )
+    }
+
 class EegAudioDataProcessor:
 
-    def __init__(self, eegData, audioData, subjectID='01', sessionID='01', runID='01', taskName='VCV'):
+    def __init__(self, eegData, audioData, subjectID='01', sessionID='01', runID='01', taskName='VCV',
+                 synchronizationState=None, writers=None):
         """
         Initialize the class with EEG and audio data.
 
@@ -25,19 +63,23 @@ class EegAudioDataProcessor:
         sessionID (str): The session ID.
         runID (str): The run ID.
         taskName (str): The name of the task.
+        synchronizationState (dict): A checkpointed synchronizationState() to restore instead of
+            synchronizing again; audioData may then be None unless the audio writer runs.
+        writers (iterable): BIDS writers run on construction outside the GUI, see exportBidsFiles.
+            None runs enabledBidsWriters().
         """
         self.eegData = eegData
         self.audioData = audioData
         self.audioSampleRate = 44100
 
         self.setUpBidsInfo(subjectID, sessionID, runID, taskName)
-        self.synchronizeEegAudioEvents()
+        if synchronizationState is None:
+            self.synchronizeEegAudioEvents()
+        else:
+            self.restoreSynchronization(synchronizationState)
         
         if not config.use_gui:
-            self.createAnnotations()
-            self.createEDFFile()
-            self.createAudio()
-            self.createEventsFileForAudio()
+            self.exportBidsFiles(writers)
 
     def setUpBidsInfo(self, subjectID, sessionID, runID, taskName):
         self.eegSampleRate = int(self.eegData.samplingFrequency)
@@ -69,126 +111,386 @@ class EegAudioDataProcessor:
         Returns:
         tuple: Contains lists of onsets, durations, and descriptions.
         """
-        onset, duration, description = zip(*[
-            (event[0], event[1], f'{event[-3]}_{event[-2]}_{event[-1]}') for event in self.synchronizedEvents
-        ])
+        cropOffset = self.eegCropStartIndex / self.eegSampleRate
+        events = self.synchronizedEvents
+        description = [
+            f'{block}_{trialType}_{word}'
+            for block, trialType, word in zip(events['block'].tolist(), events['trialType'].tolist(), events['word'].tolist())
+        ]
 
         self.annotations = mne.Annotations(
-            onset=onset,
-            duration=duration,
+            onset=events['onset'] - cropOffset,
+            duration=events['duration'],
             description=description
         )
 
-    def synchronizeEegAudioEvents(self):
+    def synchronizeEegAudioEvents(self, eventTypes=None):
         """Synchronize EEG and audio events based on their onset times and event types.
 
+        Parameters:
+        eventTypes (iterable): Optional event types to keep, e.g. ['StartReading', 'StartSaying'].
+            None synchronizes every event type.
+
         Returns:
-        list: A list of synchronized events.
+        EventTable: The synchronized events, with the columns of event_table.synchronizedEventColumns.
         """
         print('***************************Synchronizing EEG and Audio Events***************************')
         print(f'Processing for {self.fileName}')
         eegEvents = self.eegData.eegEvents
         audioEvents = self.audioData.audioEvents
 
-        eegEventsTimestamps = np.array([row[2] for row in eegEvents])
-        audioEventsStartTime = audioEvents[0][2]        
-
-        closestStartingPointInEeg = findClosestStartingIndex(eegEventsTimestamps, audioEventsStartTime)
+        eegEventsTimestamps = eegEvents['onset']
+        audioEventsStartTime = audioEvents['onset'][0]
+        audioNamesAndWords = [splitAudioEventName(name) for name in audioEvents['event'].tolist()]
+        audioNames = [name for name, _ in audioNamesAndWords]
+
+        self.eventTrainLag = 0.0
+        if config.syncAnchor == 'eventTrain':
+            self.eventTrainLag, score = findEventTrainLag(
+                eegEventsTimestamps, eegEvents['event'].tolist(),
+                audioEvents['onset'], audioNames,
+                binSize=config.syncBinSize
+            )
+            print(f'Event train lag: {self.eventTrainLag:.3f}s ({score:.0f} coinciding events)')
+
+        closestStartingPointInEeg = findClosestStartingIndex(
+            eegEventsTimestamps, audioEventsStartTime + self.eventTrainLag
+        )
         eegEvents = eegEvents[closestStartingPointInEeg:]
 
-        synchronizedEvents = []
-        audioEventTrackingIndex = 0
-        
-        for audioIndex, audioEvent in enumerate(audioEvents):
-            audioEventName = audioEvent[0].split(":")[0] 
-            try:
-                word = audioEvent[0].split(":")[1] 
-            except:
-                word = None
-            audioOnsetIndex = audioEvent[4]
-            audioOnsetTime = audioOnsetIndex / self.audioSampleRate
-            audioDuration = audioEvent[3] / self.audioSampleRate
-
-            if True:
-                for eegIndex in range(audioEventTrackingIndex, len(eegEvents)):
-                    eegEventName = eegEvents[eegIndex][0]
-                    eegOnsetIndex = eegEvents[eegIndex][4]
-                    eegOnsetTime = eegOnsetIndex / self.eegSampleRate
-                    eegDuration = eegEvents[eegIndex][3] / self.eegSampleRate
-
-                    if eegEventName == audioEventName:
-                        audioEventTrackingIndex = eegIndex + 1
-                        synchronizedEvents.append([
-                            eegOnsetTime, eegDuration, eegOnsetIndex,
-                            audioOnsetTime, audioDuration, audioOnsetIndex,
-                            eegEvents[eegIndex][2], audioEvents[audioIndex][2],
-                            audioEvent[1], eegEventName, word
-                        ])
-                        break
-        
+        eegNames = eegEvents['event'].tolist()
+        if config.syncAligner == 'banded':
+            matches = alignEventsBanded(
+                eegNames, audioNames,
+                eegEvents['onset'], audioEvents['onset'],
+                eventTypes=eventTypes, band=config.syncBand
+            )
+            print(
+                f"Banded alignment: {len(matches['missingEegEventIndex'])} missing EEG triggers, "
+                f"{len(matches['extraEegEventIndex'])} extra EEG triggers"
+            )
+        else:
+            matches = matchEventsByType(eegNames, audioNames, eventTypes=eventTypes)
+        self.matchedEventIndexes = matches
+
+        eegMatched = eegEvents[np.asarray(matches['eegEventIndex'], dtype=np.int64)]
+        audioIndexes = np.asarray(matches['audioEventIndex'], dtype=np.int64)
+        audioMatched = audioEvents[audioIndexes]
+        eegOnsetIndexes = eegMatched.data['onsetIndex']
+        audioOnsetIndexes = audioMatched.data['onsetIndex']
+        synchronizedEvents = EventTable({
+            'onset': eegOnsetIndexes / self.eegSampleRate,
+            'duration': eegMatched.data['duration'] / self.eegSampleRate,
+            'eegOnsetIndex': eegOnsetIndexes,
+            'audioOnset': audioOnsetIndexes / self.audioSampleRate,
+            'audioDuration': audioMatched.data['duration'] / self.audioSampleRate,
+            'audioOnsetIndex': audioOnsetIndexes,
+            'eegOnsetUnixTime': eegMatched.data['onset'],
+            'audioOnsetUnixTime': audioMatched.data['onset'],
+            'block': audioMatched['block'],
+            'trialType': eegMatched['event'],
+            'word': [audioNamesAndWords[audioIndex][1] for audioIndex in audioIndexes.tolist()]
+        }, categorical=('block', 'trialType', 'word'))
+
         self.synchronizedEvents = synchronizedEvents
         self.nTrials = len(self.synchronizedEvents)
+        self.estimateClockDrift()
+        self.setUpEegCropWindow()
+        self.setUpAudioCropWindow()
 
         print('***************************EEG and Audio Events synchronized***************************') 
         return synchronizedEvents
 
+    def setUpEegCropWindow(self, margin=config.eegExportCropMargin):
+        """Compute the EEG sample range exported for this session.
 
-    def synchronizeEegAudioEvents1(self):
-        """Synchronize EEG and audio events based on their onset times and event types.
+        The range spans the synchronized events plus margin seconds on both sides, clamped to the
+        session's window when eegData is a windowView of a shared recording. With
+        config.cropEegToSession disabled, or without synchronized events, the whole window (the
+        full recording when eegData is not a view) is used.
+
+        Parameters:
+        margin (float): Seconds kept before the first and after the last synchronized event.
+        """
+        nSamples = self.eegData.rawData.n_times
+        windowStartIndex = self.eegData.windowStartIndex
+        windowStopIndex = nSamples if self.eegData.windowStopIndex is None else min(nSamples, self.eegData.windowStopIndex)
+        self.eegCropStartIndex = windowStartIndex
+        self.eegCropStopIndex = windowStopIndex
+
+        if config.cropEegToSession and self.synchronizedEvents:
+            marginSamples = int(round(margin * self.eegData.samplingFrequency))
+            events = self.synchronizedEvents
+            firstOnsetIndex = events['eegOnsetIndex'].min()
+            lastEndIndex = (events['eegOnsetIndex'] + events['duration'] * self.eegSampleRate).max()
+            self.eegCropStartIndex = max(windowStartIndex, int(firstOnsetIndex) - marginSamples)
+            self.eegCropStopIndex = min(windowStopIndex, int(np.ceil(lastEndIndex)) + marginSamples)
+
+        if config.streamEegExport:
+            # Whole records only, rounded outwards except where that would cross the session window
+            recordSamples = int(round(self.eegData.samplingFrequency * self.eegData.getEdfReader().recordDuration))
+            self.eegCropStartIndex = self.eegCropStartIndex // recordSamples * recordSamples
+            if self.eegCropStartIndex < windowStartIndex:
+                self.eegCropStartIndex += recordSamples
+            self.eegCropStopIndex = -(-self.eegCropStopIndex // recordSamples) * recordSamples
+            if self.eegCropStopIndex > windowStopIndex and windowStopIndex < nSamples:
+                self.eegCropStopIndex -= recordSamples
+            self.eegCropStopIndex = min(nSamples, self.eegCropStopIndex)
+
+    def setUpAudioCropWindow(self, margin=config.audioExportCropMargin):
+        """Compute the audio frame range exported for this session.
+
+        Mirrors setUpEegCropWindow on the audio side. With config.cropAudioToSession disabled,
+        or without synchronized events, the full audio stream is used.
+
+        Parameters:
+        margin (float): Seconds kept before the first and after the last synchronized event.
+        """
+        nFrames = len(self.audioData.audio) if self.audioData.audio is not None else 0
+        self.audioCropStartIndex = 0
+        self.audioCropStopIndex = nFrames
+        if not config.cropAudioToSession or not self.synchronizedEvents:
+            return
+
+        marginFrames = int(round(margin * self.audioSampleRate))
+        events = self.synchronizedEvents
+        firstOnsetIndex = events['audioOnsetIndex'].min()
+        lastEndIndex = (events['audioOnsetIndex'] + events['audioDuration'] * self.audioSampleRate).max()
+        self.audioCropStartIndex = max(0, int(firstOnsetIndex) - marginFrames)
+        self.audioCropStopIndex = min(nFrames, int(np.ceil(lastEndIndex)) + marginFrames)
+
+    def estimateClockDrift(self):
+        """Fit the EEG/audio drift model over all synchronized events and correct their sample indices.
+
+        Sets clockDrift (see fitClockDrift) and the effective audio sampling rate implied by it, and
+        adds the correctedEegOnsetIndex / correctedAudioOnsetIndex columns to synchronizedEvents: the
+        onset of every event predicted in each stream from its partner in the other stream. The EEG
+        triggers are hardware-timed while the audio markers carry software timestamp jitter, so the
+        audio windows cut downstream (derivative store, dataset shards, audio clips) start at
+        correctedAudioOnsetIndex; EEG windows keep the measured eegOnsetIndex.
+        """
+        eegOnsetIndexes = self.synchronizedEvents['eegOnsetIndex'].astype(np.float64)
+        audioOnsetIndexes = self.synchronizedEvents['audioOnsetIndex'].astype(np.float64)
+        self.clockDrift = fitClockDrift(audioOnsetIndexes, eegOnsetIndexes)
+        self.effectiveAudioSampleRate = self.eegData.samplingFrequency / self.clockDrift['slope']
+
+        for name, values in (
+            ('correctedEegOnsetIndex', self.audioIndexToEegIndex(audioOnsetIndexes)),
+            ('correctedAudioOnsetIndex', self.eegIndexToAudioIndex(eegOnsetIndexes))
+        ):
+            self.synchronizedEvents.addColumn(name, values, synchronizedEventColumns.index(name))
+        print(
+            f"Clock drift: {(self.effectiveAudioSampleRate / self.audioSampleRate - 1) * 1e6:.1f}ppm, "
+            f"residual {self.clockDrift['residualStd']:.2f} EEG samples, "
+            f"{np.count_nonzero(~self.clockDrift['inliers'])} outliers"
+        )
+
+    def synchronizationState(self):
+        """Return the results of synchronizeEegAudioEvents as a picklable dict."""
+        return {name: getattr(self, name) for name in synchronizationAttributes}
+
+    def restoreSynchronization(self, state):
+        """Set the results of a previous synchronizeEegAudioEvents from synchronizationState()."""
+        for name in synchronizationAttributes:
+            setattr(self, name, state[name])
+
+    def audioIndexToEegIndex(self, audioIndexes):
+        """Map audio sample indexes to EEG sample indexes with the fitted drift model."""
+        audioIndexes = np.asarray(audioIndexes, dtype=np.float64)
+        eegIndexes = self.clockDrift['intercept'] + self.clockDrift['slope'] * audioIndexes
+        return np.rint(eegIndexes).astype(np.int64)
+
+    def eegIndexToAudioIndex(self, eegIndexes):
+        """Map EEG sample indexes to audio sample indexes with the fitted drift model."""
+        eegIndexes = np.asarray(eegIndexes, dtype=np.float64)
+        audioIndexes = (eegIndexes - self.clockDrift['intercept']) / self.clockDrift['slope']
+        return np.rint(audioIndexes).astype(np.int64)
+
+    def partialPath(self, path):
+        """Temporary name a file is written under before it is renamed into place."""
+        return path.with_name(path.name + '.part')
+
+    def exportBidsFiles(self, writers=None):
+        """Write the EEG, audio and events files (and optionally the derivative store) of the session concurrently.
+
+        The requested writers run in a thread pool and their timings are printed. The audio, TSV
+        and derivative files are written under temporary '.part' names and only renamed into place
+        once every writer has succeeded. The EEG writer goes through write_raw_bids, which writes
+        straight into the tree, so the session's previous EEG export is first moved aside with
+        backupEegExport. If any writer fails, the temporary files are removed, the new EEG files
+        (even partial ones from a failed EEG writer) are replaced by the previous export with
+        restoreEegExport and the first error is raised, leaving the session as it was. Only the
+        dataset-level participants.tsv and dataset_description.json may keep the subject's entry,
+        as they are shared with the other sessions.
+
+        Parameters:
+        writers (iterable): Subset of bidsWriters to run, defaults to enabledBidsWriters().
 
         Returns:
-        list: A list of synchronized events.
+        dict: Seconds spent by each writer.
         """
-        print('***************************Synchronizing EEG and Audio Events***************************')
-        print(f'Processing for {self.fileName}')
-        eegEvents = self.eegData.eegEvents
-        audioEvents = self.audioData.audioEvents
+        writers = enabledBidsWriters() if writers is None else writers
+        writers = [writer for writer in bidsWriters if writer in writers]
+        if not writers:
+            return {}
+        print('***************************Exporting BIDS files***************************')
+        self.createAnnotations()
+
+        def timed(writer, *args):
+            startTime = time.time()
+            result = writer(*args)
+            return result, time.time() - startTime
+
+        writerCalls = {
+            'eeg': (self.createEDFFile,),
+            'audio': (self.createAudio, True),
+            'events': (self.createEventsFileForAudio, True),
+            'derivatives': (self.createDerivativeStore, True)
+        }
+        if 'eeg' in writers:
+            self.backupEegExport()
+        with ThreadPoolExecutor(max_workers=len(writers)) as executor:
+            futures = {writer: executor.submit(timed, *writerCalls[writer]) for writer in writers}
+        errors = {writer: future.exception() for writer, future in futures.items() if future.exception()}
+
+        partialFiles = [
+            futures[writer].result()[0] for writer in ('audio', 'events', 'derivatives')
+            if writer in futures and writer not in errors
+        ]
+        if errors:
+            for partialFile in partialFiles:
+                self.removeOutput(partialFile)
+            if 'eeg' in futures:
+                self.restoreEegExport()
+            writer, error = next(iter(errors.items()))
+            print(f'***************************BIDS export failed in {writer} writer, previous files kept***************************')
+            raise error
+
+        for partialFile in partialFiles:
+            finalPath = Path(str(partialFile)[:-len('.part')])
+            if finalPath.is_dir():
+                self.removeOutput(finalPath)
+            os.replace(partialFile, finalPath)
+        if 'eeg' in futures:
+            shutil.rmtree(self.eegExportFiles()[3], ignore_errors=True)
+
+        timings = {writer: round(future.result()[1], 2) for writer, future in futures.items()}
+        print(f'BIDS writer timings (s): {timings}')
+        print('***************************BIDS files exported***************************')
+        return timings
+
+    def eegExportFiles(self):
+        """
+        Locations of the session's EEG export.
 
-        eegEventsTimestamps = np.array([row[2] for row in eegEvents])
-        audioEventsStartTime = audioEvents[0][2]        
+        Returns:
+        tuple: (EDF path, name prefix the EDF shares with its sidecars, session scans.tsv path,
+            folder backupEegExport moves the previous export to).
+        """
+        edfPath = bidsOutputPaths(self.subjectID, self.sessionID, self.runID, self.taskName)['eeg']
+        prefix = edfPath.name[:-len('eeg.edf')]
+        scansPath = self.destinationDir / f'sub-{self.subjectID}_ses-{self.sessionID}_scans.tsv'
+        return edfPath, prefix, scansPath, self.destinationDir / f'.{prefix}eeg_previous'
 
-        closestStartingPointInEeg = findClosestStartingIndex(eegEventsTimestamps, audioEventsStartTime)
-        eegEvents = eegEvents[closestStartingPointInEeg:]
+    def backupEegExport(self):
+        """Move the session's current EEG export aside before write_raw_bids rewrites it.
 
-        synchronizedEvents = []
-        audioEventTrackingIndex = 0
-        
-        for audioIndex, audioEvent in enumerate(audioEvents):
-            audioEventName = audioEvent[0].split(":")[0] 
-            try:
-                word = audioEvent[0].split(":")[1] 
-            except:
-                word = None
-            audioOnsetIndex = audioEvent[4]
-            audioOnsetTime = audioOnsetIndex / self.audioSampleRate
-            audioDuration = audioEvent[3] / self.audioSampleRate
-
-            if 'StartReading' in audioEventName or 'StartSaying' in audioEventName:
-                for eegIndex in range(audioEventTrackingIndex, len(eegEvents)):
-                    eegEventName = eegEvents[eegIndex][0]
-                    eegOnsetIndex = eegEvents[eegIndex][4]
-                    eegOnsetTime = eegOnsetIndex / self.eegSampleRate
-                    eegDuration = eegEvents[eegIndex][3] / self.eegSampleRate
-
-                    if eegEventName == audioEventName:
-                        audioEventTrackingIndex = eegIndex + 1
-                        synchronizedEvents.append([
-                            eegOnsetTime, eegDuration, eegOnsetIndex,
-                            audioOnsetTime, audioDuration, audioOnsetIndex,
-                            eegEvents[eegIndex][2], audioEvents[audioIndex][2],
-                            audioEvent[1], eegEventName, word
-                        ])
-                        break
-        
-        self.synchronizedEvents = synchronizedEvents
-        self.nTrials = len(self.synchronizedEvents)
+        The EDF, its sidecars and the session's scans.tsv row are moved to a hidden folder in the
+        session directory, from where restoreEegExport puts them back. A backup left behind by an
+        interrupted export holds the last complete export, so it is restored first.
+        """
+        edfPath, prefix, scansPath, backupDir = self.eegExportFiles()
+        if backupDir.is_dir():
+            self.restoreEegExport()
+        with bidsRootLock():
+            os.makedirs(backupDir)
+            if edfPath.parent.is_dir():
+                for path in edfPath.parent.iterdir():
+                    if path.name.startswith(prefix):
+                        os.replace(path, backupDir / path.name)
+            if scansPath.exists():
+                with open(scansPath, newline='', encoding='utf-8') as scansFile:
+                    rows = list(csv.reader(scansFile, delimiter='\t'))
+                saved = [row for row in rows[1:] if row and row[0] == f'eeg/{edfPath.name}']
+                if saved:
+                    with open(backupDir / 'scans.tsv', 'w', newline='', encoding='utf-8') as scansFile:
+                        csv.writer(scansFile, delimiter='\t', lineterminator='\n').writerows(rows[:1] + saved)
+
+    def restoreEegExport(self):
+        """Replace the session's EEG files by the export saved by backupEegExport, see exportBidsFiles."""
+        edfPath, _, scansPath, backupDir = self.eegExportFiles()
+        self.removeEegExport()
+        if not backupDir.is_dir():
+            return
+        with bidsRootLock():
+            savedScansPath = backupDir / 'scans.tsv'
+            for path in backupDir.iterdir():
+                if path != savedScansPath:
+                    os.makedirs(edfPath.parent, exist_ok=True)
+                    os.replace(path, edfPath.parent / path.name)
+            if savedScansPath.exists():
+                with open(savedScansPath, newline='', encoding='utf-8') as scansFile:
+                    rows = list(csv.reader(scansFile, delimiter='\t'))
+                if scansPath.exists():
+                    rows = rows[1:]
+                with open(scansPath, 'a', newline='', encoding='utf-8') as scansFile:
+                    csv.writer(scansFile, delimiter='\t', lineterminator='\n').writerows(rows)
+            shutil.rmtree(backupDir)
+
+    def removeEegExport(self):
+        """Delete the files write_raw_bids wrote for this session and its row in the session's scans.tsv.
+
+        These are the EDF and its '_eeg.json', '_channels.tsv', '_events.tsv' and '_events.json'
+        sidecars, which all share the EDF's name prefix in the session's eeg folder.
+        """
+        edfPath, prefix, scansPath, _ = self.eegExportFiles()
+        with bidsRootLock():
+            if edfPath.parent.is_dir():
+                for path in edfPath.parent.iterdir():
+                    if path.name.startswith(prefix):
+                        self.removeOutput(path)
+
+            if scansPath.exists():
+                with open(scansPath, newline='', encoding='utf-8') as scansFile:
+                    rows = list(csv.reader(scansFile, delimiter='\t'))
+                kept = [row for row in rows[1:] if row and row[0] != f'eeg/{edfPath.name}']
+                if kept:
+                    with open(scansPath, 'w', newline='', encoding='utf-8') as scansFile:
+                        csv.writer(scansFile, delimiter='\t', lineterminator='\n').writerows(rows[:1] + kept)
+                else:
+                    os.remove(scansPath)
+
+    def removeOutput(self, path):
+        """Delete an exported file, or a directory store such as a .zarr derivative."""
+        if Path(path).is_dir():
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def createDerivativeStore(self, temporary=False):
+        """Write the session's trials to the chunked derivative store, see writeDerivativeStore.
 
-        print('***************************EEG and Audio Events synchronized***************************') 
-        return synchronizedEvents
+        Parameters:
+        temporary (bool): Write under the '.part' name, see exportBidsFiles.
 
-    def createEventsFileForAudio(self):
+        Returns:
+        Path: The path of the created store.
+        """
+        print('***************************Writing derivative trial store***************************')
+        destinationPath = bidsOutputPaths(self.subjectID, self.sessionID, self.runID, self.taskName)['derivatives']
+        self.ensureDirectoryExists(destinationPath.parent)
+        if temporary:
+            destinationPath = self.partialPath(destinationPath)
+        writeDerivativeStore(self, destinationPath)
+        print('***************************Derivative trial store written***************************')
+        return destinationPath
+
+    def createEventsFileForAudio(self, temporary=False):
         """Write synchronized events to a TSV file.
 
+        Parameters:
+        temporary (bool): Write under the '.part' name, see exportBidsFiles.
+
         Returns:
         Path: The path of the created events file.
         """
@@ -198,61 +500,134 @@ class EegAudioDataProcessor:
         destinationDir = self.destinationDir / 'audio'
         self.ensureDirectoryExists(destinationDir)
         fileNameWithPath = destinationDir / fileName       
+        if temporary:
+            fileNameWithPath = self.partialPath(fileNameWithPath)
 
         with open(fileNameWithPath, "w", newline="") as tsvfile:
             writer = csv.DictWriter(tsvfile, fieldnames=bidsHeaders, delimiter='\t')
             writer.writeheader()
 
-            for row in self.synchronizedEvents:
-                event = {
-                    "onset": row[0],  
-                    "duration": row[1],
-                    "eegOnsetIndex": row[2], 
-                    "audioOnset": row[3],  
-                    "audioDuration": row[4],  
-                    "audioOnsetIndex": row[5],
-                    "eegOnsetUnixTime": row[6],
-                    "audioOnsetUnixTime": row[7],
-                    "block": row[8],
-                    "trialType": row[9],
-                    "word": row[10]
-                }
-                writer.writerow(event)
+            cropOffset = self.eegCropStartIndex / self.eegSampleRate
+            audioCropOffset = self.audioCropStartIndex / self.audioSampleRate
+            events = self.synchronizedEvents
+            columns = {name: events[name] for name in events.columnNames}
+            columns['onset'] = columns['onset'] - cropOffset
+            columns['eegOnsetIndex'] = columns['eegOnsetIndex'] - self.eegCropStartIndex
+            columns['audioOnset'] = columns['audioOnset'] - audioCropOffset
+            columns['audioOnsetIndex'] = columns['audioOnsetIndex'] - self.audioCropStartIndex
+            columns['correctedEegOnsetIndex'] = columns['correctedEegOnsetIndex'] - self.eegCropStartIndex
+            columns['correctedAudioOnsetIndex'] = columns['correctedAudioOnsetIndex'] - self.audioCropStartIndex
+            values = [columns[name].tolist() for name in bidsHeaders]
+            writer.writerows(dict(zip(bidsHeaders, row)) for row in zip(*values))
 
         print('***************************Events written to file***************************')
         return fileNameWithPath
         
-    def createAudio(self):
+    def audioExportDtype(self):
+        """Sample format of the exported WAV, from config.audioExportDtype or the stream's native format."""
+        if config.audioExportDtype != 'native':
+            return np.dtype(config.audioExportDtype)
+        return nativeAudioDtype(self.audioData.audioInfo.get('channel_format'))
+
+    def createAudio(self, temporary=False):
         """Create an audio file from audio data.
 
+        Frames [audioCropStartIndex, audioCropStopIndex) are streamed from the source buffer in
+        chunks and converted to audioExportDtype() on the way, so no full-length copy is made.
+        Full-scale float audio is scaled when it is written in an integer format. The file is a WAV
+        or a FLAC depending on config.audioExportFormat; FLAC is refused for audio it cannot hold
+        losslessly, see flac_writer.flacSubtype.
+
+        Parameters:
+        temporary (bool): Write under the '.part' name, see exportBidsFiles.
+
         Returns:
         Path: The path of the created audio file.
         """
         print('***************************Creating Audio file***************************')
         destinationDir = self.destinationDir / 'audio'
         self.ensureDirectoryExists(destinationDir)
-        audioData = self.audioData.audio
-        destinationPath = destinationDir / f'{self.fileName}_audio.wav'
-        write(str(destinationPath), self.audioSampleRate, audioData)
+        destinationPath = destinationDir / f'{self.fileName}_audio.{config.audioExportFormat}'
+        if temporary:
+            destinationPath = self.partialPath(destinationPath)
+        sourceFormat = self.audioData.audioInfo.get('channel_format')
+        audioWriters[config.audioExportFormat](
+            self.audioData.audio, destinationPath, self.audioSampleRate, dtype=self.audioExportDtype(),
+            start=self.audioCropStartIndex, stop=self.audioCropStopIndex,
+            chunkFrames=config.audioExportChunkFrames, scaleFloat=sourceFormat in ('float32', 'double64')
+        )
         print('***************************Audio file created***************************')
 
         return destinationPath
 
+    def selectExportChannels(self):
+        """Names of the EEG channels written to BIDS, honouring config.removeChannel147."""
+        channelNames = self.eegData.channelNames
+        if config.removeChannel147 and len(channelNames) > 147:
+            channelNames = channelNames[:147] + channelNames[148:]
+        return list(channelNames)
+
+    def createEDFFileStreaming(self):
+        """Create the BIDS EDF file by streaming the cropped source records in fixed-size chunks.
+
+        The selected channels (the same set createEDFFile exports, mapped to EDF signals by
+        EegDataProcessor.edfChannelIndexes) and the session's data records are copied as raw 16-bit
+        samples from the memory-mapped source EDF into a temporary EDF, chunk by chunk. That file is opened
+        lazily and handed to write_raw_bids, which copies it and writes the sidecars, so the
+        signal is never held in memory as float64. The temporary EDF lives in config.exportTempDir,
+        outside the BIDS tree, and write_raw_bids runs under bidsRootLock.
+
+        Returns:
+        Path: The BIDS path of the created EDF file.
+        """
+        print('***************************Streaming BIDS EDF file***************************')
+        reader = self.eegData.getEdfReader()
+        channelIndexes = self.eegData.edfChannelIndexes(self.selectExportChannels())
+        recordSamples = int(round(self.eegData.samplingFrequency * reader.recordDuration))
+        startRecord = self.eegCropStartIndex // recordSamples
+        stopRecord = -(-self.eegCropStopIndex // recordSamples)
+
+        with tempfile.TemporaryDirectory(dir=config.exportTempDir) as temporaryDir:
+            temporaryPath = Path(temporaryDir, f'{self.fileName}_eeg.edf')
+            writeEdfInChunks(
+                reader, temporaryPath, channelIndexes, startRecord, stopRecord,
+                chunkRecords=config.eegExportChunkRecords
+            )
+            self.newData = mne.io.read_raw_edf(temporaryPath, preload=False, verbose=False)
+            self.newData.set_annotations(self.annotations)
+            with bidsRootLock():
+                write_raw_bids(self.newData, bids_path=self.bidsPath, overwrite=True, verbose=False)
+            self.newData.close()
+
+        print('***************************BIDS EDF file created***************************')
+        return self.bidsPath.fpath
+
     def createEDFFile(self):
-        """Create a BIDS FIF file from the EEG data.
+        """Create a BIDS FIF file from the EEG data, cropped to the session window.
+
+        Only samples [eegCropStartIndex, eegCropStopIndex) are read, and the measurement date is
+        moved to the first kept sample so absolute times are preserved.
 
         Returns:
         Path: The path of the created FIF file.
         """
+        if config.streamEegExport:
+            return self.createEDFFileStreaming()
+
         print('***************************Creating BIDS FIF file***************************')
-        rawData = self.eegData.rawData.get_data()
-        self.info = self.eegData.rawData.info
+        picks = self.selectExportChannels()
+        rawData = self.eegData.rawData.get_data(picks=picks, start=self.eegCropStartIndex, stop=self.eegCropStopIndex)
+        self.info = mne.pick_info(self.eegData.rawData.info, mne.pick_channels(self.eegData.channelNames, picks, ordered=True))
 
         self.newData = mne.io.RawArray(rawData, self.info)
+        if self.info['meas_date'] is not None:
+            cropStart = timedelta(seconds=self.eegCropStartIndex / self.eegData.samplingFrequency)
+            self.newData.set_meas_date(self.info['meas_date'] + cropStart)
         self.newData.set_annotations(self.annotations)
         
         
-        write_raw_bids(self.newData, bids_path=self.bidsPath, allow_preload=True, format='EDF', overwrite=True)
+        with bidsRootLock():
+            write_raw_bids(self.newData, bids_path=self.bidsPath, allow_preload=True, format='EDF', overwrite=True)
        
         
         print('***************************BIDS FIF file created***************************')
@@ -1,14 +1,123 @@
+import copy
 import src.config as config
-from src.utils import loadEdfFile, eegNormalizeTriggers
-from src.utils import eegCorrectTriggers, eegTransitionTriggerPoints
-from src.utils import triggerEncodings
+import numpy as np
+from src.utils import loadEdfFile, loadDecodedEegTriggers
+from src.utils import eegMarkerNameTable
+from src.edf_reader import EdfReader
+from src.timebase import Timebase
+from src.event_table import EventTable
 import pdb
 
 class EegDataProcessor:
-    def __init__(self, filepath):
-        self.rawData = loadEdfFile(filepath)
+    def __init__(self, filepath, readerMode=config.edfReaderMode, triggerOnly=False):
+        """
+        Parameters:
+        filepath (str): The filepath to the EDF file.
+        readerMode (str): 'preload' or 'memmap', see config.edfReaderMode.
+        triggerOnly (bool): Read only the header and the TRIG channel. Signal channels are 
+            loaded on first access to eegRawData or when exporting.
+        """
+        self.filepath = filepath
+        self.readerMode = readerMode
+        self.triggerOnly = triggerOnly
+        self._eegRawData = None
+        self.windowStartIndex = 0
+        self.windowStopIndex = None
+        preload = readerMode != 'memmap' and not triggerOnly
+        self.rawData = loadEdfFile(filepath, preload=preload)
+        self.edfReader = EdfReader(filepath) if readerMode == 'memmap' else None
         self.setupEegDataInfo()
 
+    @property
+    def eegRawData(self):
+        if self._eegRawData is None:
+            self._eegRawData = self.getChannelData(0)
+        return self._eegRawData
+
+    def windowView(self, startTime, stopTime):
+        """
+        Returns a view of this recording restricted to one session's time window.
+
+        The view shares the loaded raw data, decoded triggers and timebase with this instance;
+        only eegEvents is filtered and windowStartIndex / windowStopIndex are set. Those bounds
+        limit the EEG range EegAudioDataProcessor.setUpEegCropWindow exports, so a session never
+        exports samples of the other sessions in the file. When the window holds no EEG event
+        (e.g. the clock offset is wrong) the full recording is returned.
+
+        Parameters:
+        startTime (float): Unix time where the window starts.
+        stopTime (float): Unix time where the window ends.
+
+        Returns:
+        EegDataProcessor: The windowed view.
+        """
+        onsets = self.eegEvents['onset']
+        inWindow = (onsets >= startTime) & (onsets <= stopTime)
+        if not inWindow.any():
+            print(f'No EEG events between {startTime} and {stopTime}, using the full recording')
+            return self
+
+        view = copy.copy(self)
+        view.eegEvents = self.eegEvents[inWindow]
+        view.windowStartIndex = self.timeBase.timeToIndex(startTime)
+        view.windowStopIndex = self.timeBase.timeToIndex(stopTime) + 1
+        return view
+
+    def getEdfReader(self):
+        """Return the memory-mapped EdfReader of this recording, opening it on first use."""
+        if self.edfReader is None:
+            self.edfReader = EdfReader(self.filepath)
+        return self.edfReader
+
+    def edfChannelIndexes(self, channels):
+        """
+        Maps MNE channel names to the signal indexes of the EDF file.
+
+        MNE drops the 'EDF Annotations' signals and renames duplicate labels, so channelNames can
+        differ from the raw EDF labels. Names are therefore mapped by position among the remaining
+        signals, which MNE keeps in file order.
+
+        Parameters:
+        channels (list): Channel names as in channelNames.
+
+        Returns:
+        list: EDF signal index of every channel.
+
+        Raises:
+        ValueError: If a channel is not in the recording or the MNE channels cannot be lined up
+            with the EDF signals.
+        """
+        reader = self.getEdfReader()
+        signalIndexes = [index for index, label in enumerate(reader.channelNames) if label != 'EDF Annotations']
+        if len(signalIndexes) != len(self.channelNames):
+            raise ValueError(
+                f'{self.filepath}: {len(self.channelNames)} MNE channels do not line up with {len(signalIndexes)} EDF signals'
+            )
+        positions = dict(zip(self.channelNames, signalIndexes))
+        missing = [channel for channel in channels if channel not in positions]
+        if missing:
+            raise ValueError(f'Channels {missing} are not in {self.filepath}')
+        return [positions[channel] for channel in channels]
+
+    def getChannelData(self, channel, start=0, stop=None):
+        """
+        Returns samples [start, stop) of one channel, read from the memory map when available.
+
+        Parameters:
+        channel (str or int): Channel name or index.
+        start (int): First sample index.
+        stop (int): Sample index after the last sample.
+
+        Returns:
+        np.ndarray: Channel samples in Volts.
+        """
+        if self.edfReader is not None:
+            if isinstance(channel, str):
+                channel = self.edfChannelIndexes([channel])[0]
+            return self.edfReader.getChannelData(channel, start, stop)
+        if isinstance(channel, str):
+            channel = self.channelNames.index(channel)
+        return self.rawData.get_data(picks=[channel], start=start, stop=stop)[0]
     
     def setupEegDataInfo(self):
         
@@ -17,28 +126,26 @@ class EegDataProcessor:
         self.startTime = self.rawData.info['meas_date']
         self.channelNames = self.rawData.ch_names
         self.samplingFrequency = self.rawData.info['sfreq']
-        self.triggers = self.rawData['TRIG'][0][0]
         self.duration = self.rawData.n_times / self.samplingFrequency
-        self.timeStamps = self.rawData.times + self.startTime.timestamp()
+        self.timeBase = Timebase(self.startTime.timestamp(), self.samplingFrequency, self.rawData.n_times)
         self.goodChannels = [item for item in self.channelNames if item not in self.badChannels]
-        self.eegRawData = self.rawData.get_data()[0]
         self.processEegData()
 
     def processEegData(self):
         print('***************************EEG Data Processing***************************')
-        self.triggersNormalized = eegNormalizeTriggers(self.triggers)
-        self.correctedTriggers = eegCorrectTriggers(self.triggersNormalized)
-        self.eegTriggerTransitionPoints = eegTransitionTriggerPoints(
-            self.correctedTriggers
-        )  
+        (
+            self.correctedTriggers, 
+            self.eegTriggerTransitionPoints, 
+            self.eegTriggerTransitionLabels
+        ) = loadDecodedEegTriggers(self.filepath, lambda: self.getChannelData('TRIG'))
         self.eegEvents = self.mapEegEvents(
             self.correctedTriggers, 
             self.eegTriggerTransitionPoints, 
-            self.timeStamps
+            self.timeBase
         )
         print('***************************EEG Data Processing Completed***************************')
 
-    def mapEegEvents(self, triggerArray, triggerTransitionPoints, timestamps):
+    def mapEegEvents(self, triggerArray, triggerTransitionPoints, timeBase):
         """
         Maps EEG trigger values to their corresponding start and end points.
 
@@ -50,42 +157,71 @@ class EegDataProcessor:
         Parameters:
         triggerArray (np.ndarray): An array of trigger values recorded during the EEG session.
         triggerTransitionPoints (np.ndarray): An array of indexes in the trigger values array where the trigger values change.
-        timestamps (np.ndarray): An array of timestamps corresponding to the trigger values.
+        timeBase (Timebase): Timebase of the EEG recording, used to convert onset indexes to timestamps.
 
         Returns:
-        List[List]: A list of lists, each representing an event with the following information:
-                - Marker name (str)
-                - Block type (Over or Inert)
-                - Start timestamp (float)
-                - Onset (Onset of eeg event)
-                - Duration (int)
-                - OnsetIndex (eeg onset Index)
+        EventTable: One row per event with the columns (see event_table.eventColumns):
+                - event: Marker name (categorical)
+                - block: Block type, Overt or Inert (categorical)
+                - onset: Onset timestamp of the eeg event (float)
+                - duration: Duration in samples (int)
+                - onsetIndex: eeg onset index (int)
             
         Example:
         >>> triggerArray = np.array([0, 0, 1, 1, 0, 0, 2, 2, 0])
         >>> triggerPoints = np.array([0, 2, 6])
-        >>> timestamps = np.array([0.0, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0])
-        >>> EegEventsMapping(triggerArray, triggerPoints, timestamps)
-            [['StartReading', 0.0, 1.0, 0, 2, 2],
-            ['EndReading', 2.0, 3.0, 6, 8, 2]]
+        >>> timeBase = Timebase(0.0, 2, 9)
+        >>> events = EegEventsMapping(triggerArray, triggerPoints, timeBase)
+        >>> events.rows()
+            [['StartReading', None, 0.0, 2, 0],
+            ['EndReading', None, 1.0, 4, 2]]
         """
         print('***************************Mapping EEG events***************************')  
-        events = []
-        block = None
-        for i in range(triggerTransitionPoints.shape[0] - 1):
-                
-            onsetIndex = triggerTransitionPoints[i]
-            endIndex = triggerTransitionPoints[i + 1]
-            event = triggerEncodings(triggerArray[onsetIndex])
-            onset = timestamps[onsetIndex]
-            if 'BlockSaying' in event:
-                block = 'Overt'
-            if 'BlockThinking' in event:
-                block = 'Inert'
-            duration = endIndex - onsetIndex
-            if duration < 25:
-                continue
-            events.append([event, block, onset , duration, onsetIndex])
+        triggerArray = np.asarray(triggerArray)
+        triggerTransitionPoints = np.asarray(triggerTransitionPoints, dtype=np.int64)
+        onsetIndexes = triggerTransitionPoints[:-1]
+        durations = np.diff(triggerTransitionPoints)
+        eventNames = eegMarkerNameTable[triggerArray[onsetIndexes]]
+
+        blockNames = np.array([None, 'Overt', 'Inert'], dtype=object)
+        blockCodes = np.zeros(onsetIndexes.shape[0], dtype=np.int64)
+        blockCodes[eventNames == 'StartBlockSaying'] = 1
+        blockCodes[eventNames == 'StartBlockThinking'] = 2
+        lastBlockPosition = np.maximum.accumulate(
+            np.where(blockCodes > 0, np.arange(blockCodes.shape[0]), -1)
+        )
+        blocks = blockNames[np.where(lastBlockPosition >= 0, blockCodes[lastBlockPosition], 0)]
+
+        keep = durations >= 25
+        events = EventTable({
+            'event': eventNames[keep], 'block': blocks[keep], 'onset': timeBase.indexToTime(onsetIndexes[keep]),
+            'duration': durations[keep], 'onsetIndex': onsetIndexes[keep]
+        }, categorical=('event', 'block'))
         print('***************************EEG events mapped***************************')
         return events
-                
\ No newline at end of file
+
+loadedEegRecordings = {}
+
+def loadSharedEegData(filepath, **kwargs):
+    """
+    Loads and decodes an EDF recording once per process and returns the cached instance afterwards.
+
+    Sessions that were recorded into the same EDF file reuse one EegDataProcessor and take a
+    windowView of it instead of reloading and re-decoding the whole file.
+
+    Parameters:
+    filepath (str): The filepath to the EDF file.
+    **kwargs: Passed to EegDataProcessor on the first load.
+
+    Returns:
+    EegDataProcessor: The shared instance.
+    """
+    key = str(filepath)
+    if key not in loadedEegRecordings:
+        loadedEegRecordings[key] = EegDataProcessor(filepath, **kwargs)
+    return loadedEegRecordings[key]
+
+def releaseSharedEegData(filepath):
+    """Drop a recording from the shared cache once every session using it is done."""
+    loadedEegRecordings.pop(str(filepath), None)
+
@@ -0,0 +1,153 @@
+import csv
+import json
+from pathlib import Path
+
+import numpy as np
+import src.config as config
+from src.batch_processing import loadManifest
+from src.pipeline_stages import SessionPipeline
+from src.eeg_data_utils import releaseSharedEegData
+from src.trial_windows import selectTrials, epochGeometry, readEpoch
+import pdb
+
+epochMetadataColumns = [
+    'epoch', 'subjectId', 'sessionId', 'runId', 'taskName', 'trial',
+    'eegOnsetIndex', 'audioOnsetIndex', 'eegOnsetUnixTime', 'block', 'trialType', 'word'
+]
+epochEventColumns = epochMetadataColumns[6:]
+
+def writeSessionEpochs(eegAudioData, epochs, firstEpoch, trials, channels, window, chunkTrials):
+    """
+    Fill epochs[firstEpoch:firstEpoch + len(trials)] with one session's trials, chunkTrials at a time.
+
+    Returns:
+    list: Metadata rows of the written epochs, without the session columns.
+    """
+    reader = eegAudioData.eegData.getEdfReader()
+    channelIndexes = eegAudioData.eegData.edfChannelIndexes(channels)
+    startOffset, nSamples = epochGeometry(eegAudioData.eegData.samplingFrequency, window)
+    events = eegAudioData.synchronizedEvents
+
+    rows = []
+    for chunkStart in range(0, len(trials), chunkTrials):
+        chunk = trials[chunkStart:chunkStart + chunkTrials]
+        epochs[firstEpoch + chunkStart:firstEpoch + chunkStart + len(chunk)] = np.stack([
+            readEpoch(reader, channelIndexes, int(onsetIndex) + startOffset, nSamples)
+            for onsetIndex in events.data['eegOnsetIndex'][chunk]
+        ])
+        epochs.flush()
+        for offset, trial in enumerate(chunk):
+            event = events.row(trial)
+            rows.append({
+                'epoch': firstEpoch + chunkStart + offset, 'trial': int(trial),
+                **{column: event[column] for column in epochEventColumns}
+            })
+    return rows
+
+def writeEpochSidecars(destinationPath, rows, channels, samplingFrequency, window):
+    """Write the metadata TSV and a JSON description next to an epochs .npy file."""
+    destinationPath = Path(destinationPath)
+    with open(destinationPath.with_suffix('.tsv'), 'w', newline='', encoding='utf-8') as tsvFile:
+        writer = csv.DictWriter(tsvFile, fieldnames=epochMetadataColumns, delimiter='\t')
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(destinationPath.with_suffix('.json'), 'w', encoding='utf-8') as jsonFile:
+        json.dump({
+            'shape': ['epochs', 'channels', 'samples'], 'channels': list(channels),
+            'samplingFrequency': samplingFrequency, 'window': list(window), 'unit': 'V'
+        }, jsonFile, indent=1)
+
+def extractEpochs(eegAudioData, destinationPath, window=config.epochWindow, channels=None, blocks=None, trialTypes=None, chunkTrials=config.epochChunkTrials):
+    """
+    Cuts a session's synchronized trials into a memory-mapped (trials x channels x samples) array.
+
+    Epochs start window[0] seconds after each trial's eegOnsetIndex and end window[1] seconds after
+    it. They are read from the memory-mapped EDF and written to a float32 .npy file chunkTrials
+    trials at a time, so RAM use does not depend on the number of trials. A metadata TSV with one
+    row per epoch and a JSON description are written next to it.
+
+    Parameters:
+    eegAudioData (EegAudioDataProcessor): A synchronized session.
+    destinationPath (str or Path): The .npy file to create.
+    window (tuple): (tmin, tmax) in seconds relative to the onset.
+    channels (list): Channel names, defaults to the channels exported to BIDS.
+    blocks (iterable): Blocks to keep, None keeps every block.
+    trialTypes (iterable): Trial types to keep, None keeps every trial type.
+    chunkTrials (int): Trials read and written per chunk.
+
+    Returns:
+    np.memmap: The epochs array, opened read-only.
+    """
+    channels = eegAudioData.selectExportChannels() if channels is None else list(channels)
+    trials = selectTrials(eegAudioData.synchronizedEvents, blocks, trialTypes)
+    samplingFrequency = eegAudioData.eegData.samplingFrequency
+    _, nSamples = epochGeometry(samplingFrequency, window)
+
+    epochs = np.lib.format.open_memmap(
+        destinationPath, mode='w+', dtype=np.float32, shape=(len(trials), len(channels), nSamples)
+    )
+    rows = writeSessionEpochs(eegAudioData, epochs, 0, trials, channels, window, chunkTrials)
+    del epochs
+
+    sessionColumns = {
+        'subjectId': eegAudioData.subjectID, 'sessionId': eegAudioData.sessionID,
+        'runId': eegAudioData.runID, 'taskName': eegAudioData.taskName
+    }
+    writeEpochSidecars(destinationPath, [{**row, **sessionColumns} for row in rows], channels, samplingFrequency, window)
+    return np.load(destinationPath, mmap_mode='r')
+
+def extractCohortEpochs(manifestPath, destinationPath, window=config.epochWindow, channels=None, blocks=None, trialTypes=None, chunkTrials=config.epochChunkTrials):
+    """
+    Streams the epochs of every manifest session into one memory-mapped cohort array.
+
+    A first pass restores each session's checkpointed synchronization (see
+    SessionPipeline.synchronizedProcessor) to count its selected trials, the cohort array is then
+    allocated on disk and a second pass fills it session by session and chunk by chunk. Only one
+    session is held in memory at a time, so RAM stays bounded whatever the cohort size.
+
+    Parameters:
+    manifestPath (str or Path): CSV/TSV/JSON manifest, see batch_processing.loadManifest.
+    destinationPath (str or Path): The .npy file to create.
+    window, channels, blocks, trialTypes, chunkTrials: See extractEpochs. channels defaults to the
+        exported channels of the first session and must exist in every session.
+
+    Returns:
+    np.memmap: The cohort epochs array, opened read-only.
+    """
+    sessions = loadManifest(manifestPath)
+
+    def sessionProcessor(session):
+        eegAudioData = SessionPipeline(session).synchronizedProcessor()
+        releaseSharedEegData(session['edfPath'])
+        return eegAudioData
+
+    counts = []
+    samplingFrequency = None
+    for session in sessions:
+        eegAudioData = sessionProcessor(session)
+        if channels is None:
+            channels = eegAudioData.selectExportChannels()
+        if samplingFrequency is None:
+            samplingFrequency = eegAudioData.eegData.samplingFrequency
+        elif eegAudioData.eegData.samplingFrequency != samplingFrequency:
+            raise ValueError(f"{session['edfPath']} is not sampled at {samplingFrequency}Hz")
+        counts.append(len(selectTrials(eegAudioData.synchronizedEvents, blocks, trialTypes)))
+
+    _, nSamples = epochGeometry(samplingFrequency, window)
+    epochs = np.lib.format.open_memmap(
+        destinationPath, mode='w+', dtype=np.float32, shape=(sum(counts), len(channels), nSamples)
+    )
+    print(f'*******************Writing {sum(counts)} epochs of {len(sessions)} sessions to {destinationPath}*******************')
+
+    rows = []
+    firstEpoch = 0
+    for session, count in zip(sessions, counts):
+        eegAudioData = sessionProcessor(session)
+        trials = selectTrials(eegAudioData.synchronizedEvents, blocks, trialTypes)
+        sessionRows = writeSessionEpochs(eegAudioData, epochs, firstEpoch, trials, channels, window, chunkTrials)
+        rows += [{**row, **{column: session[column] for column in ('subjectId', 'sessionId', 'runId', 'taskName')}} for row in sessionRows]
+        firstEpoch += count
+    del epochs
+
+    writeEpochSidecars(destinationPath, rows, channels, samplingFrequency, window)
+    return np.load(destinationPath, mmap_mode='r')
@@ -0,0 +1,389 @@
+from collections import defaultdict
+
+import numpy as np
+import pdb
+
+def splitAudioEventName(name):
+    """
+    Splits an audio marker such as 'StartSaying:casa' into its event type and word.
+
+    Parameters:
+    name (str): Marker name from the audio events.
+
+    Returns:
+    tuple: (eventType, word) where word is None when the marker carries no word.
+    """
+    parts = name.split(':')
+    word = parts[1] if len(parts) > 1 else None
+    return parts[0], word
+
+def matchEventsByType(eegNames, audioNames, eventTypes=None):
+    """
+    Greedily matches audio events to EEG events of the same type in a single merge-style pass.
+
+    Every audio event, in order, is paired with the first EEG event of the same type that lies
+    after the previously matched EEG event; audio events without such a partner are skipped.
+    EEG event positions are pre-indexed in one queue per event type and each queue pointer only
+    moves forward, so the whole pass costs O(N + M) instead of a rescan per audio event.
+
+    Parameters:
+    eegNames (list): Event type of every EEG event.
+    audioNames (list): Event type of every audio event (without the ':word' suffix).
+    eventTypes (iterable): Optional event types to synchronize. Audio events of other types
+        are ignored. None keeps every type.
+
+    Returns:
+    dict: Columnar result with
+        - 'eegEventIndex' (np.ndarray): Position of each matched event in eegNames.
+        - 'audioEventIndex' (np.ndarray): Position of each matched event in audioNames.
+
+    Example:
+    >>> matchEventsByType(['A', 'B', 'A', 'B'], ['B', 'A', 'B'])
+    {'eegEventIndex': array([1, 2, 3]), 'audioEventIndex': array([0, 1, 2])}
+    """
+    eventQueues = defaultdict(list)
+    for eegIndex, name in enumerate(eegNames):
+        eventQueues[name].append(eegIndex)
+    queuePointers = defaultdict(int)
+    eventTypes = None if eventTypes is None else set(eventTypes)
+
+    eegEventIndex = []
+    audioEventIndex = []
+    trackingIndex = 0
+    for audioIndex, name in enumerate(audioNames):
+        if eventTypes is not None and name not in eventTypes:
+            continue
+        queue = eventQueues.get(name)
+        if not queue:
+            continue
+        pointer = queuePointers[name]
+        while pointer < len(queue) and queue[pointer] < trackingIndex:
+            pointer += 1
+        queuePointers[name] = pointer
+        if pointer == len(queue):
+            continue
+        eegIndex = queue[pointer]
+        queuePointers[name] = pointer + 1
+        trackingIndex = eegIndex + 1
+        eegEventIndex.append(eegIndex)
+        audioEventIndex.append(audioIndex)
+
+    return {
+        'eegEventIndex': np.array(eegEventIndex, dtype=np.int64),
+        'audioEventIndex': np.array(audioEventIndex, dtype=np.int64)
+    }
+
+def buildEventTrains(onsets, names, eventTypes, startTime, nBins, binSize):
+    """
+    Bins event onsets into one count train per event type.
+
+    Parameters:
+    onsets (np.ndarray): Event onsets in seconds.
+    names (list): Event type of every onset.
+    eventTypes (list): Event types to build trains for, one row each.
+    startTime (float): Time of the left edge of the first bin.
+    nBins (int): Number of bins per train.
+    binSize (float): Bin width in seconds.
+
+    Returns:
+    np.ndarray: (len(eventTypes), nBins) array of event counts.
+    """
+    onsets = np.asarray(onsets, dtype=np.float64)
+    typeIndex = {eventType: index for index, eventType in enumerate(eventTypes)}
+    rows = np.array([typeIndex.get(name, -1) for name in names], dtype=np.int64)
+    bins = np.floor((onsets - startTime) / binSize).astype(np.int64)
+    keep = (rows >= 0) & (bins >= 0) & (bins < nBins)
+
+    trains = np.bincount(
+        rows[keep] * nBins + bins[keep], minlength=len(eventTypes) * nBins
+    ).astype(np.float64)
+    return trains.reshape(len(eventTypes), nBins)
+
+def findEventTrainLag(eegOnsets, eegNames, audioOnsets, audioNames, binSize=0.1):
+    """
+    Finds the time lag that best aligns the audio event train onto the EEG event train.
+
+    Both event lists are binned into one train per shared event type and the trains are
+    cross-correlated with a zero-padded FFT, so every candidate lag is scored at once in
+    O(n log n). The scores of all event types are summed before picking the peak.
+
+    Parameters:
+    eegOnsets (np.ndarray): EEG event onsets (unix seconds).
+    eegNames (list): EEG event types.
+    audioOnsets (np.ndarray): Audio event onsets (unix seconds).
+    audioNames (list): Audio event types (without the ':word' suffix).
+    binSize (float): Bin width in seconds; sets the resolution of the lag.
+
+    Returns:
+    tuple:
+        - lag (float): Seconds to add to audio onsets to land on the matching EEG onsets.
+        - score (float): Number of coinciding events at that lag.
+    """
+    eegOnsets = np.asarray(eegOnsets, dtype=np.float64)
+    audioOnsets = np.asarray(audioOnsets, dtype=np.float64)
+    eventTypes = sorted(set(eegNames) & set(audioNames))
+    if not eventTypes or eegOnsets.size == 0 or audioOnsets.size == 0:
+        return 0.0, 0.0
+
+    eegStart = eegOnsets.min()
+    audioStart = audioOnsets.min()
+    nEegBins = int(np.floor((eegOnsets.max() - eegStart) / binSize)) + 1
+    nAudioBins = int(np.floor((audioOnsets.max() - audioStart) / binSize)) + 1
+    eegTrains = buildEventTrains(eegOnsets, eegNames, eventTypes, eegStart, nEegBins, binSize)
+    audioTrains = buildEventTrains(audioOnsets, audioNames, eventTypes, audioStart, nAudioBins, binSize)
+
+    nFft = int(2 ** np.ceil(np.log2(nEegBins + nAudioBins)))
+    spectrum = np.fft.rfft(eegTrains, nFft) * np.conj(np.fft.rfft(audioTrains, nFft))
+    correlation = np.fft.irfft(spectrum.sum(axis=0), nFft)
+
+    shifts = np.arange(nFft)
+    shifts[shifts >= nFft - nAudioBins + 1] -= nFft
+    valid = (shifts > -nAudioBins) & (shifts < nEegBins)
+    correlation = np.where(valid, correlation, -np.inf)
+    bestBin = int(np.argmax(correlation))
+
+    lag = eegStart - audioStart + shifts[bestBin] * binSize
+    lag = refineEventLag(eegOnsets, eegNames, audioOnsets, audioNames, lag, binSize)
+    return float(lag), float(np.round(correlation[bestBin]))
+
+def nearestSameTypeResiduals(eegOnsets, eegNames, audioOnsets, audioNames, lag):
+    """
+    For every audio event shifted by lag, the signed distance to the nearest EEG event of the same type.
+
+    Parameters:
+    eegOnsets (np.ndarray): EEG event onsets.
+    eegNames (list): EEG event types.
+    audioOnsets (np.ndarray): Audio event onsets.
+    audioNames (list): Audio event types.
+    lag (float or np.ndarray): Lag in seconds, or a 1D array of candidate lags.
+
+    Returns:
+    np.ndarray: Residuals (EEG onset - shifted audio onset), shape (nLags, nAudioEvents).
+        Audio events whose type never occurs in the EEG get np.inf.
+    """
+    eegOnsets = np.asarray(eegOnsets, dtype=np.float64)
+    audioOnsets = np.asarray(audioOnsets, dtype=np.float64)
+    eegNames = np.asarray(eegNames, dtype=object)
+    audioNames = np.asarray(audioNames, dtype=object)
+    lags = np.atleast_1d(np.asarray(lag, dtype=np.float64))
+    residuals = np.full((lags.shape[0], audioOnsets.shape[0]), np.inf)
+
+    for eventType in set(audioNames.tolist()):
+        typeOnsets = np.sort(eegOnsets[eegNames == eventType])
+        if typeOnsets.size == 0:
+            continue
+        columns = np.flatnonzero(audioNames == eventType)
+        shifted = audioOnsets[columns][np.newaxis, :] + lags[:, np.newaxis]
+        right = np.clip(np.searchsorted(typeOnsets, shifted), 1, max(typeOnsets.size - 1, 1))
+        left = right - 1
+        if typeOnsets.size == 1:
+            right = left = np.zeros_like(right)
+        leftResidual = typeOnsets[left] - shifted
+        rightResidual = typeOnsets[right] - shifted
+        residuals[:, columns] = np.where(
+            np.abs(rightResidual) < np.abs(leftResidual), rightResidual, leftResidual
+        )
+
+    return residuals
+
+def refineEventLag(eegOnsets, eegNames, audioOnsets, audioNames, lag, tolerance):
+    """
+    Refines a coarse lag to sub-bin precision with the median residual of events within tolerance.
+    """
+    residuals = nearestSameTypeResiduals(eegOnsets, eegNames, audioOnsets, audioNames, lag)[0]
+    close = np.abs(residuals) <= tolerance
+    if not np.any(close):
+        return lag
+    return lag + float(np.median(residuals[close]))
+
+def estimateClockOffset(eegOnsets, eegNames, audioOnsets, audioNames, hours=range(-14, 15), fineRange=1.0, fineStep=0.02, tolerance=0.05):
+    """
+    Estimates the offset between the audio (XDF) clock and the EEG (EDF) clock.
+
+    The candidate grid is every whole-hour offset in hours combined with a sub-second grid of
+    +/- fineRange seconds. All candidates are scored in one batched residual computation by the
+    number of audio events that land within tolerance of an EEG event of the same type; the
+    best candidate is then refined with the median residual of those events.
+
+    Parameters:
+    eegOnsets (np.ndarray): EEG event onsets (unix seconds).
+    eegNames (list): EEG event types.
+    audioOnsets (np.ndarray): Audio marker onsets (unix seconds, unadjusted).
+    audioNames (list): Audio event types (without the ':word' suffix).
+    hours (iterable): Whole-hour offsets to try.
+    fineRange (float): Half width in seconds of the sub-second grid around each hour.
+    fineStep (float): Step in seconds of the sub-second grid.
+    tolerance (float): Maximum residual in seconds for an event to count as matched.
+
+    Returns:
+    tuple:
+        - offset (float): Seconds to add to audio timestamps to reach the EEG clock.
+        - residual (float): Median absolute residual in seconds of the matched events.
+        - nMatched (int): Number of matched audio events at that offset.
+    """
+    fineGrid = np.arange(-fineRange, fineRange + fineStep / 2, fineStep)
+    candidates = (np.asarray(list(hours), dtype=np.float64)[:, np.newaxis] * 3600 + fineGrid).ravel()
+
+    residuals = nearestSameTypeResiduals(eegOnsets, eegNames, audioOnsets, audioNames, candidates)
+    scores = np.count_nonzero(np.abs(residuals) <= tolerance, axis=1)
+    best = int(np.argmax(scores))
+
+    offset = refineEventLag(eegOnsets, eegNames, audioOnsets, audioNames, candidates[best], tolerance)
+    finalResiduals = nearestSameTypeResiduals(eegOnsets, eegNames, audioOnsets, audioNames, offset)[0]
+    matched = np.abs(finalResiduals) <= tolerance
+    residual = float(np.median(np.abs(finalResiduals[matched]))) if np.any(matched) else float('inf')
+
+    return float(offset), residual, int(np.count_nonzero(matched))
+
+def fitClockDrift(audioOnsetIndexes, eegOnsetIndexes, nIterations=5, rejectThreshold=3.0):
+    """
+    Fits a robust linear drift model eegIndex = intercept + slope * audioIndex over matched events.
+
+    Each iteration solves the least-squares line for the current inliers in one vectorized
+    np.linalg.lstsq call and then drops pairs whose residual exceeds rejectThreshold times the
+    scaled median absolute deviation from the median residual, so a few mismatched events do
+    not bend the fit even while they still pull the current line off the true one.
+
+    Parameters:
+    audioOnsetIndexes (np.ndarray): Audio sample index of every matched event.
+    eegOnsetIndexes (np.ndarray): EEG sample index of the same events.
+    nIterations (int): Number of reweighting iterations.
+    rejectThreshold (float): Outlier threshold in robust standard deviations.
+
+    Returns:
+    dict:
+        - 'intercept' (float): EEG sample index of audio sample 0.
+        - 'slope' (float): EEG samples per audio sample.
+        - 'residualStd' (float): Standard deviation of the inlier residuals in EEG samples.
+        - 'inliers' (np.ndarray): Boolean mask of the pairs used in the final fit.
+    """
+    audioOnsetIndexes = np.asarray(audioOnsetIndexes, dtype=np.float64)
+    eegOnsetIndexes = np.asarray(eegOnsetIndexes, dtype=np.float64)
+    inliers = np.ones(audioOnsetIndexes.shape[0], dtype=bool)
+    if audioOnsetIndexes.shape[0] < 2:
+        intercept = float(eegOnsetIndexes[0] - audioOnsetIndexes[0]) if audioOnsetIndexes.shape[0] else 0.0
+        return {'intercept': intercept, 'slope': 1.0, 'residualStd': 0.0, 'inliers': inliers}
+
+    for _ in range(nIterations):
+        design = np.column_stack((np.ones(np.count_nonzero(inliers)), audioOnsetIndexes[inliers]))
+        (intercept, slope), *_ = np.linalg.lstsq(design, eegOnsetIndexes[inliers], rcond=None)
+        residuals = eegOnsetIndexes - (intercept + slope * audioOnsetIndexes)
+        center = np.median(residuals[inliers])
+        scale = 1.4826 * np.median(np.abs(residuals[inliers] - center))
+        updatedInliers = np.abs(residuals - center) <= rejectThreshold * max(scale, 1.0)
+        if np.count_nonzero(updatedInliers) < 2 or np.array_equal(updatedInliers, inliers):
+            break
+        inliers = updatedInliers
+
+    return {
+        'intercept': float(intercept),
+        'slope': float(slope),
+        'residualStd': float(np.std(residuals[inliers])),
+        'inliers': inliers
+    }
+
+def alignEventsBanded(eegNames, audioNames, eegOnsets, audioOnsets, eventTypes=None, band=50, matchScore=2.0, gapScore=-1.0, timeScale=0.5):
+    """
+    Aligns the EEG and audio event sequences with a banded Needleman-Wunsch dynamic program.
+
+    Only events of the same type can be paired. A pair scores matchScore minus a penalty (up to
+    1) for the difference between the onset gaps to the previous event in each stream, and every
+    skipped event costs gapScore. Only cells within band positions of the diagonal are kept, and
+    each DP row is updated with NumPy: the diagonal and vertical moves are elementwise, and the
+    horizontal moves are resolved with a cumulative maximum. Time and memory are O(N * band).
+    EEG events after the last matched pair are not penalised, so the EEG may run past the session.
+
+    Parameters:
+    eegNames (list): EEG event types, starting at the session anchor.
+    audioNames (list): Audio event types (without the ':word' suffix).
+    eegOnsets (np.ndarray): EEG event onsets in seconds.
+    audioOnsets (np.ndarray): Audio event onsets in seconds.
+    eventTypes (iterable): Optional event types to align; other events are left out entirely.
+    band (int): Maximum number of net insertions/deletions tolerated.
+    matchScore (float): Score of pairing two events of the same type with identical gaps.
+    gapScore (float): Score of leaving an event unmatched.
+    timeScale (float): Gap difference in seconds that removes the whole timing bonus.
+
+    Returns:
+    dict: Columnar result with
+        - 'eegEventIndex' / 'audioEventIndex' (np.ndarray): Matched pairs, as in matchEventsByType.
+        - 'extraEegEventIndex' (np.ndarray): EEG events inside the session with no audio partner.
+        - 'missingEegEventIndex' (np.ndarray): Audio events whose EEG trigger is missing.
+
+    Raises:
+    ValueError: If the audio and EEG sequences differ in length by more than band events, so no
+        alignment fits in the band.
+    """
+    eegPositions = np.arange(len(eegNames))
+    audioPositions = np.arange(len(audioNames))
+    if eventTypes is not None:
+        eventTypes = set(eventTypes)
+        eegPositions = np.array([i for i, name in enumerate(eegNames) if name in eventTypes], dtype=np.int64)
+        audioPositions = np.array([i for i, name in enumerate(audioNames) if name in eventTypes], dtype=np.int64)
+
+    codes = {}
+    eegCodes = np.array([codes.setdefault(eegNames[i], len(codes)) for i in eegPositions], dtype=np.int64)
+    audioCodes = np.array([codes.setdefault(audioNames[i], len(codes)) for i in audioPositions], dtype=np.int64)
+    eegGaps = np.diff(np.asarray(eegOnsets, dtype=np.float64)[eegPositions], prepend=np.nan)
+    audioGaps = np.diff(np.asarray(audioOnsets, dtype=np.float64)[audioPositions], prepend=np.nan)
+    nAudio, nEeg = audioCodes.shape[0], eegCodes.shape[0]
+
+    width = 2 * band + 1
+    offsets = np.arange(width) - band
+    scores = np.where((offsets >= 0) & (offsets <= nEeg), offsets * gapScore, -np.inf)
+    moves = np.zeros((nAudio + 1, width), dtype=np.int8)
+    moves[0] = 2
+
+    for i in range(1, nAudio + 1):
+        columns = i + offsets
+        valid = (columns >= 0) & (columns <= nEeg)
+        eegIndex = np.clip(columns - 1, 0, max(nEeg - 1, 0))
+
+        pairable = valid & (columns >= 1) & (eegCodes[eegIndex] == audioCodes[i - 1]) if nEeg else np.zeros(width, dtype=bool)
+        gapDifference = np.abs(eegGaps[eegIndex] - audioGaps[i - 1]) if nEeg else np.zeros(width)
+        timing = np.where(np.isnan(gapDifference), 0.0, np.minimum(gapDifference / timeScale, 1.0))
+        diagonal = np.where(pairable, scores + matchScore - timing, -np.inf)
+        vertical = np.append(scores[1:], -np.inf) + gapScore
+
+        best = np.maximum(diagonal, vertical)
+        best[~valid] = -np.inf
+        steps = np.arange(width) * gapScore
+        rowScores = np.maximum.accumulate(best - steps) + steps
+        rowScores[~valid] = -np.inf
+
+        horizontal = np.append(-np.inf, rowScores[:-1]) + gapScore
+        moves[i] = np.where(horizontal > best, 2, np.where(diagonal >= vertical, 0, 1))
+        scores = rowScores
+
+    lastColumns = nAudio + offsets
+    endScores = np.where((lastColumns >= 0) & (lastColumns <= nEeg), scores, -np.inf)
+    k = int(np.argmax(endScores))
+    if not np.isfinite(endScores[k]):
+        raise ValueError(
+            f'Cannot align {nAudio} audio events with {nEeg} EEG events within a band of {band}: '
+            f'increase syncBand to at least {abs(nAudio - nEeg)} or use the greedy aligner'
+        )
+
+    eegEventIndex, audioEventIndex, extraEeg, missingEeg = [], [], [], []
+    i = nAudio
+    while i > 0 or i + offsets[k] > 0:
+        j = i + offsets[k]
+        move = moves[i, k] if i > 0 else 2
+        if move == 0:
+            eegEventIndex.append(eegPositions[j - 1])
+            audioEventIndex.append(audioPositions[i - 1])
+            i -= 1
+        elif move == 1:
+            missingEeg.append(audioPositions[i - 1])
+            i -= 1
+            k += 1
+        else:
+            extraEeg.append(eegPositions[j - 1])
+            k -= 1
+
+    return {
+        'eegEventIndex': np.array(eegEventIndex[::-1], dtype=np.int64),
+        'audioEventIndex': np.array(audioEventIndex[::-1], dtype=np.int64),
+        'extraEegEventIndex': np.array(extraEeg[::-1], dtype=np.int64),
+        'missingEegEventIndex': np.array(missingEeg[::-1], dtype=np.int64)
+    }
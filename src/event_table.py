@@ -0,0 +1,124 @@
+import json
+import hashlib
+
+import numpy as np
+import pdb
+
+eventColumns = ['event', 'block', 'onset', 'duration', 'onsetIndex']
+synchronizedEventColumns = [
+    'onset', 'duration', 'eegOnsetIndex', 'audioOnset', 'audioDuration', 'audioOnsetIndex',
+    'eegOnsetUnixTime', 'audioOnsetUnixTime', 'correctedEegOnsetIndex', 'correctedAudioOnsetIndex',
+    'block', 'trialType', 'word'
+]
+
+def encodeCategories(values):
+    """
+    Encodes labels (strings or None) as integer codes into their categories in first-seen order.
+
+    Returns:
+    tuple: (codes as np.int32 array, categories as object array).
+    """
+    lookup = {}
+    codes = np.fromiter((lookup.setdefault(value, len(lookup)) for value in values), dtype=np.int32)
+    return codes, np.array(list(lookup), dtype=object)
+
+class EventTable:
+    def __init__(self, columns, categorical=()):
+        """
+        Array-backed table of events with named columns.
+
+        Every column is one NumPy array of the same length. Label columns listed in categorical are
+        stored as np.int32 codes into a small categories array, so filtering on them is a vectorized
+        integer comparison and a row costs a few bytes per column instead of a Python list of objects.
+        Indexing with a row index, slice, boolean mask or index array returns a new EventTable over
+        the selected rows; slices are views of the same arrays.
+
+        Parameters:
+        columns (dict): Column name -> values, in display order.
+        categorical (iterable): Names of the label columns to encode.
+
+        Example:
+        >>> events = EventTable({'event': ['StartReading', 'StartSaying'], 'onset': [0.0, 1.5]}, categorical=['event'])
+        >>> events['onset']
+            array([0. , 1.5])
+        >>> events[events.isin('event', ['StartSaying'])].row(0)
+            {'event': 'StartSaying', 'onset': 1.5}
+        """
+        self.columnNames = list(columns)
+        self.categories = {}
+        self.data = {}
+        for name, values in columns.items():
+            if name in categorical:
+                self.data[name], self.categories[name] = encodeCategories(values)
+            else:
+                self.data[name] = np.asarray(values)
+
+    @classmethod
+    def fromArrays(cls, data, categories, columnNames):
+        """Build a table from already encoded column arrays without copying them."""
+        table = cls.__new__(cls)
+        table.columnNames = list(columnNames)
+        table.data = data
+        table.categories = categories
+        return table
+
+    def __len__(self):
+        return len(self.data[self.columnNames[0]]) if self.columnNames else 0
+
+    def __getitem__(self, key):
+        """A column's values for a column name, otherwise the EventTable of the selected rows."""
+        if isinstance(key, str):
+            return self.column(key)
+        if isinstance(key, (int, np.integer)):
+            key = slice(key, key + 1 if key != -1 else None)
+        return EventTable.fromArrays(
+            {name: values[key] for name, values in self.data.items()}, self.categories, self.columnNames
+        )
+
+    def addColumn(self, name, values, position=None):
+        """Add (or replace) a non-categorical column, inserted at position in the column order (last by default)."""
+        if name in self.columnNames:
+            self.columnNames.remove(name)
+        self.columnNames.insert(len(self.columnNames) if position is None else position, name)
+        self.data[name] = np.asarray(values)
+
+    def column(self, name):
+        """Values of a column, with categorical codes decoded to their labels."""
+        if name in self.categories:
+            return self.categories[name][self.data[name]]
+        return self.data[name]
+
+    def codes(self, name):
+        """Integer codes of a categorical column."""
+        return self.data[name]
+
+    def isin(self, name, values):
+        """Boolean mask of the rows whose value in column name is one of values."""
+        if name in self.categories:
+            wanted = [code for code, label in enumerate(self.categories[name]) if label in set(values)]
+            return np.isin(self.data[name], wanted)
+        return np.isin(self.data[name], list(values))
+
+    def row(self, index):
+        """One row as a {column: value} dict of Python scalars."""
+        values = {}
+        for name in self.columnNames:
+            value = self.data[name][index]
+            if name in self.categories:
+                value = self.categories[name][value]
+            values[name] = value.item() if isinstance(value, np.generic) else value
+        return values
+
+    def rows(self):
+        """All rows as a list of lists in column order, e.g. to inspect a table in the debugger."""
+        return [list(values) for values in zip(*[self.column(name).tolist() for name in self.columnNames])]
+
+    def fingerprint(self, columns=None):
+        """Hash of the content of the given columns (all by default), used as a checkpoint key."""
+        digest = hashlib.sha256()
+        for name in self.columnNames if columns is None else columns:
+            digest.update(name.encode('utf-8'))
+            if name in self.categories:
+                digest.update(json.dumps(self.categories[name].tolist()).encode('utf-8'))
+            digest.update(np.ascontiguousarray(self.data[name]).tobytes())
+        return digest.hexdigest()
@@ -0,0 +1,54 @@
+import numpy as np
+import soundfile as sf
+from src.wav_writer import convertAudioChunk, writeWavInChunks
+import pdb
+
+def flacSubtype(dtype):
+    """
+    FLAC subtype and integer buffer format used for a requested sample format.
+
+    FLAC only stores integers of up to 24 bits, so 8 and 16-bit integer audio is written
+    losslessly as PCM_16 and every other format (int32, float32, float64) is refused rather than
+    quantized. Such audio has to be exported as WAV, or converted explicitly with
+    config.audioExportDtype = 'int16'.
+
+    Returns:
+    tuple: (subtype, np.dtype of the buffers handed to soundfile).
+
+    Raises:
+    ValueError: If dtype cannot be stored in FLAC without loss.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind in 'iu' and dtype.itemsize <= 2:
+        return 'PCM_16', np.dtype(np.int16)
+    raise ValueError(
+        f"{dtype} audio cannot be stored losslessly in FLAC (at most 24-bit integers), "
+        f"use audioExportFormat = 'wav' or audioExportDtype = 'int16'"
+    )
+
+def writeFlacInChunks(samples, destinationPath, sampleRate, dtype=None, start=0, stop=None, chunkFrames=1 << 18, scaleFloat=False):
+    """
+    Streams frames [start, stop) of an audio buffer into a lossless FLAC file.
+
+    Takes the same parameters as writeWavInChunks. Only 8 and 16-bit integer audio is accepted,
+    see flacSubtype; the check runs before the file is created.
+
+    Returns:
+    Path: destinationPath.
+    """
+    samples = samples.reshape(samples.shape[0], -1)
+    subtype, bufferDtype = flacSubtype(samples.dtype if dtype is None else dtype)
+    stop = samples.shape[0] if stop is None else min(stop, samples.shape[0])
+    start = max(0, min(start, stop))
+
+    with sf.SoundFile(
+        str(destinationPath), 'w', samplerate=int(sampleRate), channels=samples.shape[1],
+        format='FLAC', subtype=subtype
+    ) as flacFile:
+        for chunkStart in range(start, stop, chunkFrames):
+            chunk = samples[chunkStart:min(chunkStart + chunkFrames, stop)]
+            flacFile.write(np.ascontiguousarray(convertAudioChunk(chunk, bufferDtype, scaleFloat)))
+
+    return destinationPath
+
+audioWriters = {'wav': writeWavInChunks, 'flac': writeFlacInChunks}
@@ -11,6 +11,7 @@ from src.gui.utils import  getFileNameFromPath, getBackgroundColor, getTextColor
 from src.eeg_audio_data import EegAudioDataProcessor
 from src.gui.mapping_page import EegAudioMappingWindow
 import src.config as config
+from src.event_table import eventColumns
 
 class LoadEegThread(QThread):
     finished = pyqtSignal(object)
@@ -22,7 +23,7 @@ class LoadEegThread(QThread):
 
     def run(self):
         try:
-            eegData = EegDataProcessor(self.filePath)
+            eegData = EegDataProcessor(self.filePath, triggerOnly=True)
             self.finished.emit(eegData)
         except Exception as e:
             self.error.emit(str(e))
@@ -89,6 +90,7 @@ class MainWindow(QMainWindow):
         self.audioSelectFileButton.clicked.connect(self.openFileExplorer)
         self.audioLoadFileButton.clicked.connect(self.loadAudioFile)
         self.updateTimeDifferenceButton.clicked.connect(self.updateAudioTimeDifference)
+        self.detectTimeDifferenceButton.clicked.connect(self.detectAudioTimeDifference)
         
         self.synchronizeEegAudioButton.clicked.connect(self.openSynchronizationPage)
 
@@ -115,20 +117,22 @@ class MainWindow(QMainWindow):
     def updateEegInfoOnPage(self):
         self.eegSamplingFreqText.setText(str(self.eegData.samplingFrequency))
         self.eegDurationText.setText(str(self.eegData.duration))
-        self.eegStartTimeText.setText(str(unixToRealTime(self.eegData.timeStamps[0])))
-        self.eegEndTimeText.setText(str(unixToRealTime(self.eegData.timeStamps[-1])))
+        self.eegStartTimeText.setText(str(unixToRealTime(self.eegData.timeBase.startTime)))
+        self.eegEndTimeText.setText(str(unixToRealTime(self.eegData.timeBase.endTime)))
         self.eegAvailableChannelsList.addItems(self.eegData.channelNames)
         self.addEegDataToEventsTable()
 
     def addEegDataToEventsTable(self):
-        data = self.eegData.eegEvents
-        nRows = len(data)
-        self.eegEventsTable.setRowCount(nRows)
-        for rowIndex in range(nRows):
-            for colIndex in range(len(data[0])):
-                item = QTableWidgetItem(str(data[rowIndex][colIndex]))
-                item.setBackground(QBrush(getBackgroundColor(data[rowIndex][1])))
-                item.setForeground(QBrush(getTextColor(data[rowIndex][0])))
+        events = self.eegData.eegEvents
+        columns = [events[name].tolist() for name in eventColumns]
+        blocks = events['block'].tolist()
+        names = events['event'].tolist()
+        self.eegEventsTable.setRowCount(len(events))
+        for rowIndex in range(len(events)):
+            for colIndex, values in enumerate(columns):
+                item = QTableWidgetItem(str(values[rowIndex]))
+                item.setBackground(QBrush(getBackgroundColor(blocks[rowIndex])))
+                item.setForeground(QBrush(getTextColor(names[rowIndex])))
                 self.eegEventsTable.setItem(rowIndex, colIndex, item)
 
     def eegVisualizeSelectedChannels(self):
@@ -300,9 +304,11 @@ class MainWindow(QMainWindow):
         timeDifferenceLayout = QHBoxLayout()
         self.timeDifferenceText = QLineEdit('0')
         self.updateTimeDifferenceButton = QPushButton('Update')
+        self.detectTimeDifferenceButton = QPushButton('Detect')
         timeDifferenceLayout.addWidget(QLabel('Time Difference (in hours):'))   
         timeDifferenceLayout.addWidget(self.timeDifferenceText)
         timeDifferenceLayout.addWidget(self.updateTimeDifferenceButton)
+        timeDifferenceLayout.addWidget(self.detectTimeDifferenceButton)
         layout.addLayout(timeDifferenceLayout)
 
         # Audio Sampling Frequency and Duration
@@ -363,14 +369,16 @@ class MainWindow(QMainWindow):
         self.waitingMessageBox.accept()
 
     def addAudioDataToEventsTable(self):
-        data = self.audioData.audioEvents
-        nRows = len(data)
-        self.audioEventsTable.setRowCount(nRows)
-        for rowIndex in range(nRows):
-            for colIndex in range(len(data[0])):
-                item = QTableWidgetItem(str(data[rowIndex][colIndex]))
-                item.setBackground(QBrush(getBackgroundColor(data[rowIndex][1])))
-                item.setForeground(QBrush(getTextColor(data[rowIndex][0])))
+        events = self.audioData.audioEvents
+        columns = [events[name].tolist() for name in eventColumns]
+        blocks = events['block'].tolist()
+        names = events['event'].tolist()
+        self.audioEventsTable.setRowCount(len(events))
+        for rowIndex in range(len(events)):
+            for colIndex, values in enumerate(columns):
+                item = QTableWidgetItem(str(values[rowIndex]))
+                item.setBackground(QBrush(getBackgroundColor(blocks[rowIndex])))
+                item.setForeground(QBrush(getTextColor(names[rowIndex])))
                 self.audioEventsTable.setItem(rowIndex, colIndex, item)
 
     def updateAudioInfoOnPage(self):
@@ -384,10 +392,16 @@ class MainWindow(QMainWindow):
 
     def updateAudioTimeDifference(self):
         if self.audioData:
-            timeDifference = int(self.timeDifferenceText.text())
+            timeDifference = float(self.timeDifferenceText.text())
             self.audioData.mapAudioEvents(timeDifference=timeDifference)
             self.updateAudioInfoOnPage()
 
+    def detectAudioTimeDifference(self):
+        if self.audioData and self.eegData:
+            timeDifference = self.audioData.detectTimeDifference(self.eegData)
+            self.timeDifferenceText.setText(f'{timeDifference:.6f}')
+            self.updateAudioInfoOnPage()
+
     def openSynchronizationPage(self):
         if not self.audioData or not self.eegData:
             return
@@ -15,6 +15,11 @@ import src.config as config
 import sys
 from PyQt5.QtWidgets import QPushButton
 
+mappingTableColumns = [
+    'block', 'trialType', 'word', 'onset', 'audioOnset', 'duration',
+    'eegOnsetIndex', 'audioOnsetIndex', 'eegOnsetUnixTime', 'audioOnsetUnixTime'
+]
+
 class SaveBidsFiles(QThread):
     finished = pyqtSignal()
     error = pyqtSignal(str)
@@ -29,10 +34,7 @@ class SaveBidsFiles(QThread):
     def run(self):
         try:
             self.eegAudioData.setUpBidsInfo(self.subjecId, self.sessionId, self.runId, self.taskName)
-            self.eegAudioData.createAnnotations()
-            self.eegAudioData.createEDFFile()
-            self.eegAudioData.createAudio()
-            self.eegAudioData.createEventsFileForAudio()
+            self.eegAudioData.exportBidsFiles()
             self.finished.emit()
         except Exception as e:
             self.error.emit(str(e))
@@ -244,30 +246,20 @@ class EegAudioMappingWindow(QMainWindow):
 
     def updateMappingInfoTable(self):
 
-        data = self.eegAudioData.synchronizedEvents
-        self.synchronizedEventsTable.setRowCount(len(data))
-        
-        for rowIndex, event in enumerate(data):
-            self.synchronizedEventsTable.setItem(rowIndex, 0, QTableWidgetItem(str(event[8])))    
-            self.synchronizedEventsTable.setItem(rowIndex, 1, QTableWidgetItem(str(event[9])))    
-            self.synchronizedEventsTable.setItem(rowIndex, 2, QTableWidgetItem(str(event[10])))    
-            self.synchronizedEventsTable.setItem(rowIndex, 3, QTableWidgetItem(str(event[0])))    
-            self.synchronizedEventsTable.setItem(rowIndex, 4, QTableWidgetItem(str(event[3])))    
-            self.synchronizedEventsTable.setItem(rowIndex, 5, QTableWidgetItem(str(event[1])))    
-            self.synchronizedEventsTable.setItem(rowIndex, 6, QTableWidgetItem(str(event[2])))    
-            self.synchronizedEventsTable.setItem(rowIndex, 7, QTableWidgetItem(str(event[5])))
-            self.synchronizedEventsTable.setItem(rowIndex, 8, QTableWidgetItem(str(event[6])))
-            self.synchronizedEventsTable.setItem(rowIndex, 9, QTableWidgetItem(str(event[7])))
-            
-
-            backgroundColor = getBackgroundColor(event[8])
-            textColor = getTextColor(event[9])   
-
-            for col in range(self.synchronizedEventsTable.columnCount()):
-                item = self.synchronizedEventsTable.item(rowIndex, col)
-                if item:
-                    item.setBackground(backgroundColor)
-                    item.setForeground(textColor)           
+        events = self.eegAudioData.synchronizedEvents
+        columns = [events[name].tolist() for name in mappingTableColumns]
+        blocks = events['block'].tolist()
+        trialTypes = events['trialType'].tolist()
+        self.synchronizedEventsTable.setRowCount(len(events))
+
+        for rowIndex in range(len(events)):
+            backgroundColor = getBackgroundColor(blocks[rowIndex])
+            textColor = getTextColor(trialTypes[rowIndex])
+            for colIndex, values in enumerate(columns):
+                item = QTableWidgetItem(str(values[rowIndex]))
+                item.setBackground(backgroundColor)
+                item.setForeground(textColor)
+                self.synchronizedEventsTable.setItem(rowIndex, colIndex, item)
 
     def setUpBidsInfo(self):
         self.subjecId = self.subjectIdTextBox.text()
@@ -0,0 +1,133 @@
+import os
+import json
+import pickle
+import shutil
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import src.config as config
+import pdb
+
+class ParseCache:
+    def __init__(self, directory=config.parseCacheDir, maxGb=config.parseCacheMaxGb):
+        """
+        Persistent on-disk cache of parsed EDF/XDF results.
+
+        Every entry is a directory holding its arrays as .npy files, which are opened memory-mapped
+        on a hit, and its remaining Python objects in one pickle. Entries are keyed by the kind of
+        result, the parameters it was parsed with and the source file's path, size, modification
+        time and a content hash sampled from its start, middle and end. The total size is capped
+        at maxGb by evicting the least recently used entries.
+
+        Parameters:
+        directory (str or Path): Directory holding the cache entries.
+        maxGb (float): Size cap of the cache.
+        """
+        self.directory = Path(directory)
+        self.maxBytes = int(maxGb * 1024 ** 3)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def sampledContentHash(self, filepath, sampleBytes=1 << 20):
+        """Hash sampleBytes from the start, middle and end of a file without reading all of it."""
+        size = os.path.getsize(filepath)
+        digest = hashlib.blake2b(digest_size=20)
+        with open(filepath, 'rb') as inputFile:
+            for offset in sorted({0, max(0, size // 2 - sampleBytes // 2), max(0, size - sampleBytes)}):
+                inputFile.seek(offset)
+                digest.update(inputFile.read(sampleBytes))
+        return digest.hexdigest()
+
+    def entryPath(self, filepath, kind, parameters=None):
+        """
+        Directory of the cache entry for one parsed result of a file.
+
+        Parameters:
+        filepath (str or Path): Source file.
+        kind (str): Name of the parsed result, e.g. 'eegTriggers' or 'xdf'.
+        parameters: JSON-serializable settings the result depends on.
+
+        Returns:
+        Path: Entry directory, which may not exist yet.
+        """
+        stat = os.stat(filepath)
+        key = json.dumps([
+            kind, parameters, str(Path(filepath).resolve()), stat.st_size, stat.st_mtime_ns,
+            self.sampledContentHash(filepath)
+        ], sort_keys=True, default=str)
+        return self.directory / f'{kind}_{hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]}'
+
+    def load(self, filepath, kind, parameters=None):
+        """
+        Return a cached result, or None on a miss.
+
+        Returns:
+        tuple: (arrays, objects) with arrays a dict of read-only memory-mapped np.ndarrays.
+        """
+        entryPath = self.entryPath(filepath, kind, parameters)
+        objectsPath = entryPath / 'objects.pkl'
+        if not objectsPath.exists():
+            return None
+
+        print(f'*******************Loading cached {kind} of {filepath}*******************')
+        arrays = {path.stem: np.load(path, mmap_mode='r') for path in entryPath.glob('*.npy')}
+        with open(objectsPath, 'rb') as objectsFile:
+            objects = pickle.load(objectsFile)
+        os.utime(objectsPath)
+        return arrays, objects
+
+    def store(self, filepath, kind, arrays, objects, parameters=None):
+        """
+        Save a parsed result and evict the least recently used entries beyond the size cap.
+
+        The entry is written to a temporary directory and renamed into place, so concurrent
+        readers and writers never see a partial entry.
+
+        Parameters:
+        filepath (str or Path): Source file.
+        kind (str): Name of the parsed result.
+        arrays (dict): Numeric np.ndarrays, saved as memory-mappable .npy files.
+        objects: Any other picklable data.
+        parameters: JSON-serializable settings the result depends on.
+        """
+        entryPath = self.entryPath(filepath, kind, parameters)
+        temporaryPath = entryPath.with_name(f'{entryPath.name}.{os.getpid()}.tmp')
+        os.makedirs(temporaryPath, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(temporaryPath / f'{name}.npy', np.asarray(array))
+        with open(temporaryPath / 'objects.pkl', 'wb') as objectsFile:
+            pickle.dump(objects, objectsFile)
+
+        try:
+            os.rename(temporaryPath, entryPath)
+        except OSError:
+            shutil.rmtree(temporaryPath, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache is under its size cap."""
+        entries = []
+        for entryPath in self.directory.iterdir():
+            objectsPath = entryPath / 'objects.pkl'
+            if entryPath.suffix == '.tmp' or not objectsPath.exists():
+                continue
+            size = sum(path.stat().st_size for path in entryPath.iterdir())
+            entries.append((objectsPath.stat().st_mtime, size, entryPath))
+
+        totalBytes = sum(size for _, size, _ in entries)
+        for _, size, entryPath in sorted(entries, key=lambda entry: entry[0]):
+            if totalBytes <= self.maxBytes:
+                break
+            shutil.rmtree(entryPath, ignore_errors=True)
+            totalBytes -= size
+
+parseCache = None
+
+def getParseCache():
+    """Return the process-wide ParseCache, or None when config.useParseCache is disabled."""
+    global parseCache
+    if not config.useParseCache:
+        return None
+    if parseCache is None:
+        parseCache = ParseCache()
+    return parseCache
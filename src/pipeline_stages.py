@@ -0,0 +1,281 @@
+import os
+import json
+import pickle
+import hashlib
+from pathlib import Path
+
+import src.config as config
+from src.eeg_data_utils import loadSharedEegData
+from src.audio_data_utils import AudioDataProcessor
+from src.eeg_audio_data import EegAudioDataProcessor, bidsOutputPaths, enabledBidsWriters
+import pdb
+
+pipelineStages = ['loadEeg', 'loadAudio', 'decodeTriggers', 'sync', 'writeEdf', 'writeWav', 'writeEvents', 'writeDerivatives']
+writerStages = {'eeg': 'writeEdf', 'audio': 'writeWav', 'events': 'writeEvents', 'derivatives': 'writeDerivatives'}
+
+# Bumped when the pickled synchronization result changes shape, so older checkpoints are recomputed
+synchronizationFormat = 'eventTable-2'
+
+def stageKey(*parts):
+    """Hash the JSON form of the given parts into a stage key."""
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def atomicWrite(path, data, binary=False):
+    """Write data under a temporary name and rename it into place so readers never see half a file."""
+    temporaryPath = Path(f'{path}.{os.getpid()}.tmp')
+    with open(temporaryPath, 'wb' if binary else 'w') as outputFile:
+        outputFile.write(data)
+    os.replace(temporaryPath, path)
+
+class CheckpointStore:
+    def __init__(self, directory=config.checkpointDir):
+        """
+        On-disk record of the stage keys and small stage outputs of every session.
+
+        Each session has a JSON file mapping stage names to the key they were last completed with,
+        and the synchronization result is pickled next to it. File content hashes are cached by
+        path, size and modification time so an unchanged recording is only hashed once.
+
+        Parameters:
+        directory (str or Path): Directory holding the checkpoint files.
+        """
+        self.directory = Path(directory)
+        self.hashDir = self.directory / 'hashes'
+        os.makedirs(self.hashDir, exist_ok=True)
+
+    def fileHash(self, filepath, chunkBytes=1 << 24):
+        """
+        Content hash of a file, recomputed only when its size or modification time changed.
+
+        Parameters:
+        filepath (str or Path): File to hash.
+        chunkBytes (int): Bytes read per chunk.
+
+        Returns:
+        str: Hex blake2b digest of the file content.
+        """
+        stat = os.stat(filepath)
+        cachePath = self.hashDir / f'{hashlib.sha1(str(Path(filepath).resolve()).encode()).hexdigest()}.json'
+        if cachePath.exists():
+            with open(cachePath) as cacheFile:
+                cached = json.load(cacheFile)
+            if cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime_ns:
+                return cached['hash']
+
+        digest = hashlib.blake2b(digest_size=20)
+        with open(filepath, 'rb') as inputFile:
+            for chunk in iter(lambda: inputFile.read(chunkBytes), b''):
+                digest.update(chunk)
+        fileHash = digest.hexdigest()
+        atomicWrite(cachePath, json.dumps({'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': fileHash}))
+        return fileHash
+
+    def keysPath(self, sessionName):
+        return self.directory / f'{sessionName}.json'
+
+    def statePath(self, sessionName, stage):
+        return self.directory / f'{sessionName}_{stage}.pkl'
+
+    def loadKeys(self, sessionName):
+        """Return the {stage: key} dict recorded for a session, empty when it never ran."""
+        path = self.keysPath(sessionName)
+        if not path.exists():
+            return {}
+        with open(path) as keysFile:
+            return json.load(keysFile)
+
+    def recordKeys(self, sessionName, keys):
+        """Mark the given stages of a session as completed with their keys."""
+        recorded = self.loadKeys(sessionName)
+        recorded.update(keys)
+        atomicWrite(self.keysPath(sessionName), json.dumps(recorded, indent=1))
+
+    def loadState(self, sessionName, stage, key):
+        """Return the pickled output of a stage if it was saved under key, else None."""
+        path = self.statePath(sessionName, stage)
+        if self.loadKeys(sessionName).get(stage) != key or not path.exists():
+            return None
+        with open(path, 'rb') as stateFile:
+            return pickle.load(stateFile)
+
+    def saveState(self, sessionName, stage, key, state):
+        """Pickle the output of a stage and record it as completed with key."""
+        atomicWrite(self.statePath(sessionName, stage), pickle.dumps(state), binary=True)
+        self.recordKeys(sessionName, {stage: key})
+
+class SessionPipeline:
+    def __init__(self, session, store=None):
+        """
+        One session's conversion expressed as checkpointed stages.
+
+        The stages are load EEG, load audio, decode triggers, sync, write EDF, write WAV and write
+        events. Every stage key hashes the content of its input files, the keys of the stages it
+        depends on and the config values it reads. On a rerun only stages whose key changed or whose
+        output file is missing are recomputed, and the recordings are only loaded when one of them
+        needs it, so an interrupted batch resumes where it stopped. Changing only the audio time
+        offset, for instance, changes the sync key and the events key but not the EDF or WAV keys,
+        so only the events TSV is rewritten.
+
+        Parameters:
+        session (dict): One manifest row, see batch_processing.loadManifest.
+        store (CheckpointStore): Checkpoint store, defaults to one in config.checkpointDir.
+        """
+        self.session = session
+        self.store = store if store is not None else CheckpointStore()
+        self.sessionName = (
+            f"sub-{session['subjectId']}_ses-{session['sessionId']}"
+            f"_task-{session['taskName']}_run-{session['runId']}"
+        )
+        self.eegData = None
+        self.audioData = None
+        self.eegAudioData = None
+        self.computedStages = []
+
+    def inputKeys(self):
+        """Keys of the load and decode stages, which depend on the input files and reader config only."""
+        edfHash = self.store.fileHash(self.session['edfPath'])
+        xdfHash = self.store.fileHash(self.session['xdfPath'])
+        keys = {
+            'loadEeg': stageKey('loadEeg', edfHash),
+            'loadAudio': stageKey('loadAudio', xdfHash, config.xdfMarkerStreamQuery, config.xdfAudioStreamQuery),
+        }
+        keys['decodeTriggers'] = stageKey('decodeTriggers', keys['loadEeg'])
+        keys['sync'] = stageKey(
+            'sync', synchronizationFormat, keys['decodeTriggers'], keys['loadAudio'],
+            config.timeDifference, config.autoTimeDifference, config.sessionWindowMargin,
+            config.syncAnchor, config.syncBinSize, config.syncAligner, config.syncBand,
+            config.cropEegToSession, config.eegExportCropMargin, config.streamEegExport,
+            config.cropAudioToSession, config.audioExportCropMargin
+        )
+        return keys
+
+    def writerKeys(self, keys, state):
+        """
+        Keys of the writer stages.
+
+        Each one only hashes the part of the synchronization result its file is built from: the EDF
+        depends on the crop window and the EEG side of the annotations, the WAV on the audio input
+        and its crop window, the events TSV on every synchronized column and the derivative store on
+        both inputs and the synchronized events.
+        """
+        sessionIds = [self.session[column] for column in ('subjectId', 'sessionId', 'runId', 'taskName')]
+        events = state['synchronizedEvents']
+        annotations = events.fingerprint(['onset', 'duration', 'block', 'trialType', 'word'])
+        return {
+            'writeEdf': stageKey(
+                'writeEdf', keys['decodeTriggers'], sessionIds, annotations,
+                state['eegCropStartIndex'], state['eegCropStopIndex'],
+                config.removeChannel147, config.streamEegExport
+            ),
+            'writeWav': stageKey(
+                'writeWav', keys['loadAudio'], sessionIds, state['audioCropStartIndex'], state['audioCropStopIndex'],
+                config.audioExportDtype, config.audioExportFormat
+            ),
+            'writeEvents': stageKey(
+                'writeEvents', sessionIds, events.fingerprint(),
+                state['eegCropStartIndex'], state['audioCropStartIndex'], config.bidsEventsHeader
+            ),
+            'writeDerivatives': stageKey(
+                'writeDerivatives', keys['decodeTriggers'], keys['loadAudio'], sessionIds, events.fingerprint(),
+                config.derivativeBackend, config.epochWindow, config.removeChannel147
+            ),
+        }
+
+    def staleWriters(self, writerKeys):
+        """Writers whose key differs from the recorded one or whose output file is missing."""
+        recorded = self.store.loadKeys(self.sessionName)
+        outputs = bidsOutputPaths(
+            self.session['subjectId'], self.session['sessionId'], self.session['runId'], self.session['taskName']
+        )
+        return [
+            writer for writer, stage in writerStages.items()
+            if writer in enabledBidsWriters() and (recorded.get(stage) != writerKeys[stage] or not outputs[writer].exists())
+        ]
+
+    def loadEeg(self):
+        """Load and decode the EDF (load EEG and decode triggers stages)."""
+        if self.eegData is None:
+            self.eegData = loadSharedEegData(self.session['edfPath'], triggerOnly=True)
+            self.computedStages += ['loadEeg', 'decodeTriggers']
+        return self.eegData
+
+    def loadAudio(self):
+        """Load the XDF streams (load audio stage), detecting the clock offset when configured."""
+        if self.audioData is None:
+            self.audioData = AudioDataProcessor(self.session['xdfPath'])
+            if config.autoTimeDifference:
+                self.audioData.detectTimeDifference(self.loadEeg())
+            self.computedStages.append('loadAudio')
+        return self.audioData
+
+    def synchronize(self):
+        """Run the sync stage on the session's EEG window."""
+        eegData = self.loadEeg().windowView(
+            self.loadAudio().audioStartTime - config.sessionWindowMargin,
+            self.audioData.audioEndTime + config.sessionWindowMargin
+        )
+        self.computedStages.append('sync')
+        return self.createProcessor(eegData)
+
+    def createProcessor(self, eegData, synchronizationState=None):
+        return EegAudioDataProcessor(
+            eegData=eegData,
+            audioData=self.audioData,
+            taskName=self.session['taskName'],
+            subjectID=self.session['subjectId'],
+            sessionID=self.session['sessionId'],
+            runID=self.session['runId'],
+            synchronizationState=synchronizationState,
+            writers=()
+        )
+
+    def synchronizedProcessor(self):
+        """
+        Return the session's EegAudioDataProcessor with its sync stage up to date, without exporting.
+
+        The checkpointed synchronization is restored when its key is fresh, so only the EEG
+        header and triggers are loaded; otherwise the sync stage runs and is checkpointed.
+        """
+        keys = self.inputKeys()
+        state = self.store.loadState(self.sessionName, 'sync', keys['sync'])
+        if state is not None:
+            return self.createProcessor(self.loadEeg(), synchronizationState=state)
+
+        processor = self.synchronize()
+        self.store.saveState(self.sessionName, 'sync', keys['sync'], processor.synchronizationState())
+        return processor
+
+    def run(self):
+        """
+        Bring every stage of the session up to date.
+
+        Returns:
+        dict: 'nTrials', 'computedStages' (stages that ran) and 'writers' (files rewritten).
+        """
+        keys = self.inputKeys()
+        state = self.store.loadState(self.sessionName, 'sync', keys['sync'])
+
+        if state is not None:
+            writerKeys = self.writerKeys(keys, state)
+            writers = self.staleWriters(writerKeys)
+            if writers:
+                if 'audio' in writers or 'derivatives' in writers:
+                    self.loadAudio()
+                self.eegAudioData = self.createProcessor(self.loadEeg(), synchronizationState=state)
+                self.eegAudioData.exportBidsFiles(writers)
+        else:
+            self.eegAudioData = self.synchronize()
+            state = self.eegAudioData.synchronizationState()
+            self.store.saveState(self.sessionName, 'sync', keys['sync'], state)
+            writerKeys = self.writerKeys(keys, state)
+            writers = self.staleWriters(writerKeys)
+            self.eegAudioData.exportBidsFiles(writers)
+
+        self.computedStages += [writerStages[writer] for writer in writers]
+        self.store.recordKeys(self.sessionName, {
+            stage: keys[stage] for stage in ('loadEeg', 'loadAudio', 'decodeTriggers') if stage in self.computedStages
+        })
+        self.store.recordKeys(self.sessionName, {writerStages[writer]: writerKeys[writerStages[writer]] for writer in writers})
+        print(f"{self.sessionName}: recomputed {self.computedStages or 'nothing'}")
+        return {'nTrials': state['nTrials'], 'computedStages': self.computedStages, 'writers': writers}
@@ -0,0 +1,141 @@
+import numpy as np
+import pdb
+
+class Timebase:
+    def __init__(self, startTime, samplingFrequency, nSamples, segmentIndices=None, segmentTimes=None, segmentRates=None):
+        """
+        Compact description of the sample clock of a recording.
+
+        A recording is stored as one or more affine segments (start index, start time, rate)
+        instead of one timestamp per sample. Index-to-time and time-to-index queries are
+        answered arithmetically and accept scalars or arrays; a full timestamp array is only
+        built when toArray() is called.
+
+        Parameters:
+        startTime (float): Unix time of the first sample.
+        samplingFrequency (float): Sampling rate in Hz.
+        nSamples (int): Number of samples in the recording.
+        segmentIndices (np.ndarray): First sample index of each segment (piecewise clocks only).
+        segmentTimes (np.ndarray): Time of the first sample of each segment.
+        segmentRates (np.ndarray): Sampling rate of each segment.
+        """
+        self.samplingFrequency = float(samplingFrequency)
+        self.nSamples = int(nSamples)
+        if segmentIndices is None:
+            segmentIndices = np.array([0], dtype=np.int64)
+            segmentTimes = np.array([startTime], dtype=np.float64)
+            segmentRates = np.array([samplingFrequency], dtype=np.float64)
+        self.segmentIndices = np.asarray(segmentIndices, dtype=np.int64)
+        self.segmentTimes = np.asarray(segmentTimes, dtype=np.float64)
+        self.segmentRates = np.asarray(segmentRates, dtype=np.float64)
+        self.segmentEnds = np.append(self.segmentIndices[1:], self.nSamples) - 1
+
+    @classmethod
+    def fromTimestamps(cls, timestamps, samplingFrequency, breakFactor=1.5):
+        """
+        Build a timebase from a per-sample timestamp array, e.g. an XDF stream.
+
+        The array is split wherever the step between consecutive timestamps is not positive or
+        exceeds breakFactor times the median step (clock resets and recording gaps). Each
+        segment keeps only its first timestamp and its mean rate.
+
+        Parameters:
+        timestamps (np.ndarray): Per-sample timestamps.
+        samplingFrequency (float): Nominal or effective sampling rate, used for one-sample segments.
+        breakFactor (float): Step size, relative to the median step, that starts a new segment.
+
+        Returns:
+        Timebase: The piecewise affine timebase.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        nSamples = timestamps.shape[0]
+        if nSamples < 2:
+            startTime = timestamps[0] if nSamples else 0.0
+            return cls(startTime, samplingFrequency, nSamples)
+
+        steps = np.diff(timestamps)
+        medianStep = np.median(steps)
+        breaks = np.flatnonzero((steps <= 0) | (steps > breakFactor * medianStep)) + 1
+        segmentIndices = np.concatenate(([0], breaks))
+        segmentEnds = np.append(breaks, nSamples) - 1
+
+        segmentTimes = timestamps[segmentIndices]
+        segmentLengths = segmentEnds - segmentIndices
+        segmentSpans = timestamps[segmentEnds] - segmentTimes
+        segmentRates = np.full(segmentIndices.shape[0], float(samplingFrequency))
+        valid = (segmentLengths > 0) & (segmentSpans > 0)
+        segmentRates[valid] = segmentLengths[valid] / segmentSpans[valid]
+
+        return cls(segmentTimes[0], samplingFrequency, nSamples, segmentIndices, segmentTimes, segmentRates)
+
+    def __len__(self):
+        return self.nSamples
+
+    @property
+    def startTime(self):
+        return float(self.segmentTimes[0])
+
+    @property
+    def endTime(self):
+        return float(self.indexToTime(self.nSamples - 1))
+
+    @property
+    def duration(self):
+        return self.endTime - self.startTime
+
+    def shift(self, offset):
+        """
+        Return a copy of the timebase moved by offset seconds. Costs O(number of segments).
+        """
+        return Timebase(
+            self.startTime + offset, self.samplingFrequency, self.nSamples,
+            self.segmentIndices, self.segmentTimes + offset, self.segmentRates
+        )
+
+    def indexToTime(self, indices):
+        """
+        Parameters:
+        indices (int or np.ndarray): Sample indexes.
+
+        Returns:
+        float or np.ndarray: Timestamps of the samples.
+        """
+        indices = np.asarray(indices)
+        segment = np.searchsorted(self.segmentIndices, indices, side='right') - 1
+        segment = np.clip(segment, 0, self.segmentIndices.shape[0] - 1)
+        return self.segmentTimes[segment] + (indices - self.segmentIndices[segment]) / self.segmentRates[segment]
+
+    def timeToIndex(self, times):
+        """
+        Map times to the index of the nearest sample, clipped to the recording.
+
+        Parameters:
+        times (float or np.ndarray): Times in the same clock as the timebase.
+
+        Returns:
+        int or np.ndarray: Nearest sample indexes.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        nSegments = self.segmentIndices.shape[0]
+        segment = np.searchsorted(self.segmentTimes, times, side='right') - 1
+        segment = np.clip(segment, 0, nSegments - 1)
+
+        position = self.segmentIndices[segment] + (times - self.segmentTimes[segment]) * self.segmentRates[segment]
+        indices = np.ceil(position - 0.5).astype(np.int64)
+        indices = np.clip(indices, self.segmentIndices[segment], self.segmentEnds[segment])
+
+        if nSegments > 1:
+            nextSegment = np.minimum(segment + 1, nSegments - 1)
+            gapToEnd = np.abs(times - self.indexToTime(indices))
+            gapToNext = np.abs(self.segmentTimes[nextSegment] - times)
+            useNext = (segment < nSegments - 1) & (gapToNext < gapToEnd)
+            indices = np.where(useNext, self.segmentIndices[nextSegment], indices)
+
+        indices = np.clip(indices, 0, max(self.nSamples - 1, 0))
+        if indices.ndim == 0:
+            return int(indices)
+        return indices
+
+    def toArray(self):
+        """Materialise the per-sample timestamp array."""
+        return self.indexToTime(np.arange(self.nSamples))
@@ -0,0 +1,44 @@
+import numpy as np
+import pdb
+
+def selectTrials(synchronizedEvents, blocks=None, trialTypes=None):
+    """
+    Indexes of the synchronized events kept by a block and trial type filter.
+
+    Parameters:
+    synchronizedEvents (EventTable): EegAudioDataProcessor.synchronizedEvents.
+    blocks (iterable): Blocks to keep, None keeps every block.
+    trialTypes (iterable): Trial types to keep, None keeps every trial type.
+
+    Returns:
+    np.ndarray: Row indexes in event order.
+    """
+    mask = np.ones(len(synchronizedEvents), dtype=bool)
+    if blocks is not None:
+        mask &= synchronizedEvents.isin('block', blocks)
+    if trialTypes is not None:
+        mask &= synchronizedEvents.isin('trialType', trialTypes)
+    return np.flatnonzero(mask)
+
+def epochGeometry(samplingFrequency, window):
+    """Return (offset of the first sample from the onset, samples per epoch) for a (tmin, tmax) window in seconds."""
+    startOffset = int(round(window[0] * samplingFrequency))
+    return startOffset, int(round(window[1] * samplingFrequency)) - startOffset
+
+def readEpoch(reader, channelIndexes, start, nSamples):
+    """Read one (nChannels, nSamples) epoch, NaN-padded where it runs past the recording."""
+    epoch = np.full((len(channelIndexes), nSamples), np.nan, dtype=np.float32)
+    block = reader.getSampleBlock(channelIndexes, start, start + nSamples)
+    if block.shape[1]:
+        first = max(0, -start)
+        epoch[:, first:first + block.shape[1]] = block
+    return epoch
+
+def readAudioWindow(audio, start, nSamples):
+    """Read audio frames [start, start + nSamples) as (nSamples, nChannels), zero-padded past the stream."""
+    audio = audio.reshape(audio.shape[0], -1)
+    window = np.zeros((nSamples, audio.shape[1]), dtype=audio.dtype)
+    first = max(0, -start)
+    block = audio[max(0, start):max(0, start + nSamples)]
+    window[first:first + block.shape[0]] = block
+    return window
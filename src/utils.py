@@ -2,8 +2,8 @@ import mne
 import pyxdf
 import numpy as np
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
 import src.config as config
+from src.parse_cache import getParseCache
 import pdb
 
 def findClosestStartingIndex(timeStamps, time):
@@ -11,29 +11,18 @@ def findClosestStartingIndex(timeStamps, time):
     closestIndex = np.argmin(differences)
     return closestIndex
 
-def findNearestIndex(audioTimestamps, marker):
-    
-    idx = np.searchsorted(audioTimestamps, marker, side="left")
-    if idx == 0:
-        return 0
-    elif idx == len(audioTimestamps):
-        return len(audioTimestamps) - 1
-    else:
-        if abs(audioTimestamps[idx] - marker) < abs(audioTimestamps[idx - 1] - marker):
-            return idx
-        else:
-            return idx - 1
-
-def findNearestIndices(audioTimestamps, markerTimestamps):
-    audioTimestamps = np.sort(audioTimestamps)
-    nearestIndices = []
-    
-    with ThreadPoolExecutor(max_workers=config.numWorkers) as executor:
-        futures = [executor.submit(findNearestIndex, audioTimestamps, marker) for marker in markerTimestamps]
-        for future in futures:
-            nearestIndices.append(future.result())
-    
-    return nearestIndices
+eegMarkerNames = {
+    255: 'StartReading',
+    224: 'ITI',#'EndReading',
+    192: 'StartSaying',
+    160: 'Fixation',#'EndSaying',
+    128: 'StartBlockSaying',
+    96: 'StartBlockThinking',
+    64: 'EXPERIMENT_RESTART',
+    32: 'ExperimentResting',
+    16: 'ExperimentStarted',
+    8: 'ExperimentEnded'
+}
 
 def triggerEncodings(code):
     """
@@ -58,30 +47,40 @@ def triggerEncodings(code):
     >>> TriggerEncodings(10)
     'ExperimentEnded'
     """
-    
-    markerNames = {
-        255: 'StartReading',
-        224: 'ITI',#'EndReading',
-        192: 'StartSaying',
-        160: 'Fixation',#'EndSaying',
-        128: 'StartBlockSaying',
-        96: 'StartBlockThinking',
-        64: 'EXPERIMENT_RESTART',
-        32: 'ExperimentResting',
-        16: 'ExperimentStarted',
-        8: 'ExperimentEnded'
-    }
-
-    markerName = markerNames.get(code)
+    markerName = eegMarkerNames.get(code)
     
     if markerName:
         return markerName
     
-    closestCode = min(markerNames.keys(), key=lambda k: abs(k - code))
-    closestMarkerName = markerNames[closestCode]
+    closestCode = min(eegMarkerNames.keys(), key=lambda k: abs(k - code))
+    closestMarkerName = eegMarkerNames[closestCode]
     
     return closestMarkerName
 
+def buildTriggerLookupTables():
+    """
+    Precomputes the 256-entry lookup tables used to decode EEG trigger codes.
+
+    Every possible normalized trigger value (0-255) is mapped once to the nearest valid code 
+    and to the marker name of that value, so that decoding a recording reduces to NumPy 
+    fancy indexing instead of a Python call per sample or per event.
+
+    Returns:
+    tuple: 
+        - nearestCodeTable (np.ndarray): Array of length 256 with the nearest valid code for each value.
+        - markerNameTable (np.ndarray): Object array of length 256 with the marker name for each value.
+    """
+    validCodes = sorted(eegMarkerNames.keys())
+    nearestCodeTable = np.array(
+        [min(validCodes, key=lambda x: abs(x - i)) for i in range(256)],
+        dtype=np.int64
+    )
+    markerNameTable = np.array([triggerEncodings(i) for i in range(256)], dtype=object)
+    
+    return nearestCodeTable, markerNameTable
+
+eegNearestCodeTable, eegMarkerNameTable = buildTriggerLookupTables()
+
 def eegNormalizeTriggers(triggerValues):
     """
     Normalizes EEG trigger values to a range from 0 to 255.
@@ -105,7 +104,7 @@ def eegNormalizeTriggers(triggerValues):
     array([255, 204, 153, 102,  51])
     """
     print(f'****************Normalizing Triggers********************')
-    triggerValues = triggerValues * -1
+    triggerValues = np.asarray(triggerValues) * -1
     triggerMin = np.min(triggerValues)
     triggerMax = np.max(triggerValues)
     
@@ -116,48 +115,36 @@ def eegNormalizeTriggers(triggerValues):
 
 def eegCorrectTriggers(triggers):
     """
-    Corrects a list of EEG triggers by mapping them to the nearest valid code
+    Corrects an array of EEG triggers by mapping them to the nearest valid code
     from a predefined set of correct codes.
 
-    This function takes a list of integer EEG trigger codes and corrects them by mapping 
-    each trigger to the nearest valid code from a predefined set of valid codes. If a trigger 
-    code is not in the predefined set, it is mapped to the closest valid code.
+    Each trigger is looked up in the precomputed eegNearestCodeTable, so the whole array is 
+    corrected with a single NumPy indexing operation. Codes above 255 are mapped to the code 
+    of 255 and reported once as a coding error.
 
     Parameters:
-    triggers (list of int): A list of integer trigger codes to be corrected.
+    triggers (np.ndarray): An array of integer trigger codes to be corrected.
 
     Returns:
-    list of int: A list of corrected trigger codes. Each input trigger is either directly 
-                 mapped if it exists in the valid codes, or mapped to the nearest valid code 
-                 if it does not.
+    np.ndarray: An array of corrected trigger codes. Each input trigger is either directly 
+                mapped if it exists in the valid codes, or mapped to the nearest valid code 
+                if it does not.
 
     Example:
-    >>> triggers = [5, 20, 100, 130]
+    >>> triggers = np.array([5, 20, 100, 130])
     >>> CorrectEegTriggers(triggers)
-    [8, 16, 96, 128]
+    array([8, 16, 96, 128])
     """
     print(f'****************Correcting Triggers********************')
-    correctCodings = {
-        255: 255, 224: 224, 192: 192, 160: 160,
-        128: 128, 96: 96, 64: 64, 32: 32, 16: 16, 8: 8
-    }
-
-    validCodes = sorted(correctCodings.keys())
-
-    maxTrigger = max(validCodes)
-    nearestCodeMap = {}
-
-    for i in range(maxTrigger + 1):
-        nearestCode = min(validCodes, key=lambda x: abs(x - i))
-        nearestCodeMap[i] = correctCodings[nearestCode]
-
-    correctedTriggers = []
-    for trigger in triggers:
-        if trigger in nearestCodeMap:
-            correctedTriggers.append(nearestCodeMap[trigger])
-        else:
-            correctedTriggers.append(nearestCodeMap[maxTrigger])
-            print('Trigger coding Error')
+    triggers = np.asarray(triggers, dtype=np.int64)
+    maxTrigger = eegNearestCodeTable.shape[0] - 1
+
+    outOfRange = (triggers < 0) | (triggers > maxTrigger)
+    if np.any(outOfRange):
+        print(f'Trigger coding Error: {np.count_nonzero(outOfRange)} samples')
+        triggers = np.where(outOfRange, maxTrigger, triggers)
+
+    correctedTriggers = eegNearestCodeTable[triggers]
     
     return correctedTriggers
 
@@ -183,24 +170,94 @@ def eegTransitionTriggerPoints(triggerArray):
     array([0, 2, 6])
     """
     print(f'**************** Calculating EEG Transition Indexes********************')
-    differenceArray = np.where(np.diff(triggerArray) > 0)[0] + 1
-    transitionPointsIndexes = np.array([0] + differenceArray.tolist())
+    differenceArray = np.flatnonzero(np.diff(triggerArray) > 0) + 1
+    transitionPointsIndexes = np.concatenate(([0], differenceArray))
     
     return transitionPointsIndexes
 
-def loadEdfFile(filepath):
+def eegDecodeTriggers(triggerValues):
+    """
+    Decodes a raw EEG trigger channel into corrected codes, transition points and event labels.
+
+    Runs normalization, lookup-table correction and transition detection back to back and 
+    labels every transition point through eegMarkerNameTable. No step loops over samples 
+    in Python.
+
+    Parameters:
+    triggerValues (np.ndarray): Raw values of the TRIG channel.
+
+    Returns:
+    tuple:
+        - normalizedTriggers (np.ndarray): Triggers normalized to 0-255.
+        - correctedTriggers (np.ndarray): Triggers snapped to the nearest valid code.
+        - transitionPoints (np.ndarray): Indexes where the trigger code rises.
+        - transitionLabels (np.ndarray): Marker name at each transition point.
+    """
+    normalizedTriggers = eegNormalizeTriggers(triggerValues)
+    correctedTriggers = eegCorrectTriggers(normalizedTriggers)
+    transitionPoints = eegTransitionTriggerPoints(correctedTriggers)
+    transitionLabels = eegMarkerNameTable[correctedTriggers[transitionPoints]]
+
+    return normalizedTriggers, correctedTriggers, transitionPoints, transitionLabels
+
+def loadDecodedEegTriggers(filepath, readTriggers):
+    """
+        Read and decode the trigger channel of an EDF file through the parse cache.
+
+        Only what event mapping uses is kept, in the smallest dtype that fits: the corrected codes
+        (0-255) as uint8, one byte per sample instead of the eight of the raw channel, and the
+        transition points. On a cache hit both are memory-mapped from the cache and neither the
+        TRIG channel nor the decoding is computed again.
+
+        Parameters:
+        - filepath (str): The filepath to the EDF file.
+        - readTriggers (callable): Returns the raw TRIG channel, only called on a cache miss.
+
+        Returns:
+        - tuple: (correctedTriggers, transitionPoints, transitionLabels), see eegDecodeTriggers.
+    """
+    cache = getParseCache()
+    cached = cache.load(filepath, 'eegTriggerCodes') if cache is not None else None
+    if cached is not None:
+        arrays, _ = cached
+    else:
+        _, correctedTriggers, transitionPoints, _ = eegDecodeTriggers(readTriggers())
+        arrays = {
+            'corrected': correctedTriggers.astype(np.uint8),
+            'transitionPoints': transitionPoints.astype(np.min_scalar_type(max(correctedTriggers.shape[0], 1)))
+        }
+        if cache is not None:
+            cache.store(filepath, 'eegTriggerCodes', arrays, None)
+
+    transitionLabels = eegMarkerNameTable[arrays['corrected'][arrays['transitionPoints']]]
+    return arrays['corrected'], arrays['transitionPoints'], transitionLabels
+
+def loadEdfFile(filepath, preload=True):
+    """
+        Load an EDF file with MNE.
+
+        Parameters:
+        - filepath (str): The filepath to the EDF file.
+        - preload (bool): Load every channel into memory. With False only the header is read 
+          and MNE reads samples on demand.
+
+        Returns:
+        - raw (mne.io.Raw): The MNE raw object.
+    """
     print(f'*******************Loading {filepath} File*******************')
-    raw = mne.io.read_raw_edf(filepath, preload=True, verbose=False)
+    raw = mne.io.read_raw_edf(filepath, preload=preload, verbose=False)
     print(f'*******************Loaded {filepath} File*******************')
 
     return raw
 
-def loadXdfFile(filepath):
+def loadXdfFile(filepath, selectStreams=None):
     """
         Load data from an XDF (Extensible Data Format) file.
 
         Parameters:
         - filepath (str): The filepath to the XDF file.
+        - selectStreams (list): Optional stream ids (or pyxdf query dicts) to load. Streams that 
+          are not selected are skipped instead of being decoded.
 
         Returns:
         - streams (list): A list containing streams of data loaded from the XDF file using pyxdf library.
@@ -213,11 +270,134 @@ def loadXdfFile(filepath):
     print('***************************Loading .xdf file***************************')
     
     # Use pyxdf library to load data from the XDF file
-    streams, header = pyxdf.load_xdf(filepath)
+    streams, header = pyxdf.load_xdf(filepath, select_streams=selectStreams)
     print('*******************************Completed*******************************')
 
     return streams, header
 
+def resolveXdfStreams(filepath):
+    """
+        Read only the stream headers of an XDF file.
+
+        Parameters:
+        - filepath (str): The filepath to the XDF file.
+
+        Returns:
+        - streamInfos (list): One dict per stream with stream_id, name, type, nominal_srate, 
+          channel_count and channel_format. No samples are decoded.
+    """
+    print('***************************Resolving .xdf streams***************************')
+    return pyxdf.resolve_streams(filepath)
+
+def selectXdfStreamIds(streamInfos, markerQuery=config.xdfMarkerStreamQuery, audioQuery=config.xdfAudioStreamQuery):
+    """
+        Pick the marker and audio stream ids from the XDF stream headers.
+
+        The configured queries (name/type/... as understood by pyxdf.match_streaminfos) are 
+        tried first. If a query matches nothing, the marker stream falls back to the first 
+        irregular-rate stream and the audio stream to the stream with the highest nominal rate.
+
+        Parameters:
+        - streamInfos (list): Output of resolveXdfStreams.
+        - markerQuery (list): pyxdf query for the marker stream.
+        - audioQuery (list): pyxdf query for the audio stream.
+
+        Returns:
+        - markerStreamId (int): Stream id of the markers.
+        - audioStreamId (int): Stream id of the audio.
+    """
+    markerIds = pyxdf.match_streaminfos(streamInfos, markerQuery)
+    audioIds = pyxdf.match_streaminfos(streamInfos, audioQuery)
+
+    if markerIds:
+        markerStreamId = markerIds[0]
+    else:
+        irregular = [info for info in streamInfos if float(info['nominal_srate']) == 0]
+        markerStreamId = irregular[0]['stream_id']
+
+    if audioIds:
+        audioStreamId = audioIds[0]
+    else:
+        regular = [info for info in streamInfos if info['stream_id'] != markerStreamId]
+        audioStreamId = max(regular, key=lambda info: float(info['nominal_srate']))['stream_id']
+
+    return markerStreamId, audioStreamId
+
+def loadXdfMarkersAndAudio(filepath, markersOnly=False):
+    """
+        Load only the marker and audio streams of an XDF file.
+
+        Results go through the parse cache: on a hit the stream arrays are memory-mapped from 
+        the cache instead of parsing the XDF again, and a cached audio stream is returned even 
+        with markersOnly since mapping it costs nothing.
+
+        Parameters:
+        - filepath (str): The filepath to the XDF file.
+        - markersOnly (bool): Decode the marker stream only. The audio stream is described by 
+          its header but its samples are not loaded.
+
+        Returns:
+        - markerStream (dict): The pyxdf marker stream.
+        - audioStream (dict): The pyxdf audio stream, or None with markersOnly.
+        - audioInfo (dict): Header of the audio stream from resolveXdfStreams.
+        - header (dict): File header.
+    """
+    cache = getParseCache()
+    parameters = [config.xdfMarkerStreamQuery, config.xdfAudioStreamQuery]
+    if cache is not None:
+        for kind in (['xdf', 'xdfMarkers'] if markersOnly else ['xdf']):
+            cached = cache.load(filepath, kind, parameters)
+            if cached is not None:
+                return unpackXdfStreams(*cached)
+
+    streamInfos = resolveXdfStreams(filepath)
+    markerStreamId, audioStreamId = selectXdfStreamIds(streamInfos)
+    audioInfo = [info for info in streamInfos if info['stream_id'] == audioStreamId][0]
+
+    selectStreams = [markerStreamId] if markersOnly else [markerStreamId, audioStreamId]
+    streams, header = loadXdfFile(filepath, selectStreams=selectStreams)
+    streamsById = {stream['info']['stream_id']: stream for stream in streams}
+    result = streamsById[markerStreamId], streamsById.get(audioStreamId), audioInfo, header
+
+    if cache is not None:
+        cache.store(filepath, 'xdfMarkers' if markersOnly else 'xdf', *packXdfStreams(*result), parameters=parameters)
+    return result
+
+def packXdfStreams(markerStream, audioStream, audioInfo, header):
+    """
+        Split the result of loadXdfMarkersAndAudio into numeric arrays and other objects for the parse cache.
+
+        Returns:
+        - arrays (dict): The ndarray fields of both streams, named '<stream>_<field>'.
+        - objects (dict): Every other field, the audio info and the header.
+    """
+    arrays = {}
+    objects = {'audioInfo': audioInfo, 'header': header}
+    for name, stream in (('marker', markerStream), ('audio', audioStream)):
+        if stream is None:
+            objects[name] = None
+            continue
+        objects[name] = {}
+        for field, value in stream.items():
+            if isinstance(value, np.ndarray) and value.dtype != object:
+                arrays[f'{name}_{field}'] = value
+            else:
+                objects[name][field] = value
+    return arrays, objects
+
+def unpackXdfStreams(arrays, objects):
+    """Rebuild the result of loadXdfMarkersAndAudio from a parse cache entry, see packXdfStreams."""
+    streams = []
+    for name in ('marker', 'audio'):
+        stream = objects[name]
+        if stream is not None:
+            stream = dict(stream)
+            for key, array in arrays.items():
+                if key.startswith(f'{name}_'):
+                    stream[key[len(name) + 1:]] = array
+        streams.append(stream)
+    return streams[0], streams[1], objects['audioInfo'], objects['header']
+
 def adjustAudioTime(unixTimestamps, timeDifference):
     gapUnix = timeDifference * 3600
     return unixTimestamps + gapUnix
@@ -0,0 +1,96 @@
+import struct
+
+import numpy as np
+import pdb
+
+xdfChannelFormats = {
+    'int8': np.int16, 'int16': np.int16, 'int32': np.int32, 'int64': np.int32,
+    'float32': np.float32, 'double64': np.float64
+}
+
+def nativeAudioDtype(channelFormat):
+    """
+    Sample format WAV export uses for an XDF channel_format.
+
+    int8 is widened to int16 (8-bit WAV is unsigned) and int64 narrowed to int32, the widest
+    integer WAV format; unknown formats fall back to float32.
+    """
+    return np.dtype(xdfChannelFormats.get(channelFormat, np.float32))
+
+def writeWavHeader(wavFile, sampleRate, nChannels, dtype, nFrames):
+    """
+    Writes a canonical 44-byte RIFF/WAVE header.
+
+    Parameters:
+    wavFile (file): File opened in binary mode, positioned at 0.
+    sampleRate (int): Frames per second.
+    nChannels (int): Number of interleaved channels.
+    dtype (np.dtype): Sample format, integer PCM or IEEE float.
+    nFrames (int): Number of frames that will follow.
+    """
+    dtype = np.dtype(dtype)
+    formatTag = 3 if dtype.kind == 'f' else 1
+    blockAlign = nChannels * dtype.itemsize
+    dataBytes = nFrames * blockAlign
+    wavFile.write(b'RIFF' + struct.pack('<I', 36 + dataBytes) + b'WAVE')
+    wavFile.write(b'fmt ' + struct.pack(
+        '<IHHIIHH', 16, formatTag, nChannels, int(sampleRate), int(sampleRate) * blockAlign,
+        blockAlign, 8 * dtype.itemsize
+    ))
+    wavFile.write(b'data' + struct.pack('<I', dataBytes))
+
+def convertAudioChunk(chunk, dtype, scaleFloat):
+    """
+    Converts a block of samples to the output sample format.
+
+    Integer targets are rounded and clipped to their range. With scaleFloat, floating point
+    input is treated as full scale [-1, 1] and scaled to the integer range; otherwise sample
+    values are kept as they are, as for integer audio that pyxdf returned in a float array.
+    """
+    dtype = np.dtype(dtype)
+    if chunk.dtype == dtype:
+        return chunk
+    if dtype.kind == 'f':
+        if chunk.dtype.kind in 'iu' and scaleFloat:
+            return (chunk / np.iinfo(chunk.dtype).max).astype(dtype)
+        return chunk.astype(dtype)
+
+    limits = np.iinfo(dtype)
+    if chunk.dtype.kind == 'f':
+        if scaleFloat:
+            chunk = chunk * limits.max
+        chunk = np.rint(chunk)
+    return np.clip(chunk, limits.min, limits.max).astype(dtype)
+
+def writeWavInChunks(samples, destinationPath, sampleRate, dtype=None, start=0, stop=None, chunkFrames=1 << 18, scaleFloat=False):
+    """
+    Streams frames [start, stop) of an audio buffer into a WAV file.
+
+    The buffer (e.g. a memory-mapped stream from the parse cache) is converted and written
+    chunkFrames frames at a time, so peak memory is one chunk whatever the session length.
+
+    Parameters:
+    samples (np.ndarray): (nFrames,) or (nFrames, nChannels) audio samples.
+    destinationPath (str or Path): WAV file to create.
+    sampleRate (int): Frames per second written to the header.
+    dtype (np.dtype): Output sample format, defaults to the buffer's own.
+    start (int): First frame to write.
+    stop (int): Frame after the last one to write, defaults to the end.
+    chunkFrames (int): Frames converted and written per chunk.
+    scaleFloat (bool): Scale between full-scale float and integer formats, see convertAudioChunk.
+
+    Returns:
+    Path: destinationPath.
+    """
+    samples = samples.reshape(samples.shape[0], -1)
+    dtype = np.dtype(samples.dtype if dtype is None else dtype).newbyteorder('<')
+    stop = samples.shape[0] if stop is None else min(stop, samples.shape[0])
+    start = max(0, min(start, stop))
+
+    with open(destinationPath, 'wb') as wavFile:
+        writeWavHeader(wavFile, sampleRate, samples.shape[1], dtype, stop - start)
+        for chunkStart in range(start, stop, chunkFrames):
+            chunk = samples[chunkStart:min(chunkStart + chunkFrames, stop)]
+            wavFile.write(np.ascontiguousarray(convertAudioChunk(chunk, dtype, scaleFloat)).tobytes())
+
+    return destinationPath
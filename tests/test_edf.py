@@ -0,0 +1,104 @@
+import numpy as np
+
+from src.edf_reader import EdfReader
+from src.edf_writer import writeEdfInChunks
+
+def field(value, width):
+    return str(value)[:width].ljust(width)
+
+def writeSyntheticEdf(path, digital, samplesPerRecord, labels, nRecords, recordDuration=1):
+    """
+    Write a minimal 16-bit EDF file and return the digital samples of each signal.
+
+    Parameters:
+    path (Path): EDF file to create.
+    digital (list): One int16 array of nRecords * samplesPerRecord samples per signal.
+    samplesPerRecord (list): Samples per data record of each signal.
+    labels (list): Signal labels.
+    nRecords (int): Number of data records.
+    recordDuration (int): Duration of a data record in seconds.
+    """
+    nSignals = len(labels)
+    header = ''.join([
+        field('0', 8), field('X X X X', 80), field('Startdate 01-JAN-2024 X X X', 80),
+        '01.01.24', '12.30.00', field(256 * (nSignals + 1), 8), field('', 44),
+        field(nRecords, 8), field(recordDuration, 8), field(nSignals, 4),
+    ])
+    signalFields = [
+        (labels, 16), (['AgAgCl'] * nSignals, 80), (['uV'] * nSignals, 8),
+        (['-3276.8'] * nSignals, 8), (['3276.7'] * nSignals, 8),
+        (['-32768'] * nSignals, 8), (['32767'] * nSignals, 8),
+        ([''] * nSignals, 80), (samplesPerRecord, 8), ([''] * nSignals, 32),
+    ]
+    for values, width in signalFields:
+        header += ''.join(field(value, width) for value in values)
+
+    records = np.concatenate([
+        signal.reshape(nRecords, count) for signal, count in zip(digital, samplesPerRecord)
+    ], axis=1)
+    with open(path, 'wb') as edfFile:
+        edfFile.write(header.encode('latin-1'))
+        edfFile.write(records.astype('<i2').tobytes())
+
+def makeRecording(path, nRecords=12, seed=0):
+    """Write a synthetic recording with two EEG signals and a slower status signal."""
+    rng = np.random.default_rng(seed)
+    samplesPerRecord = [16, 16, 4]
+    labels = ['Fp1', 'Fp2', 'Status']
+    digital = [rng.integers(-32768, 32768, nRecords * count, dtype=np.int16) for count in samplesPerRecord]
+    writeSyntheticEdf(path, digital, samplesPerRecord, labels, nRecords)
+    return digital
+
+def toPhysical(digital):
+    """Scale digital samples with the synthetic header's 0.1 uV per bit gain to Volts."""
+    return digital.astype(np.float64) * 0.1 * 1e-6
+
+def test_reader_parses_header(tmp_path):
+    path = tmp_path / 'synthetic.edf'
+    makeRecording(path)
+    reader = EdfReader(path)
+    assert reader.channelNames == ['Fp1', 'Fp2', 'Status']
+    assert reader.nRecords == 12
+    assert reader.recordDuration == 1.0
+    np.testing.assert_array_equal(reader.samplesPerRecord, [16, 16, 4])
+    np.testing.assert_allclose(reader.samplingFrequencies, [16.0, 16.0, 4.0])
+    assert reader.startTime.strftime('%Y-%m-%d %H:%M:%S') == '2024-01-01 12:30:00'
+
+def test_reader_slices_across_records(tmp_path):
+    path = tmp_path / 'synthetic.edf'
+    digital = makeRecording(path)
+    reader = EdfReader(path)
+    np.testing.assert_allclose(reader.getChannelData('Fp2'), toPhysical(digital[1]), atol=1e-12)
+    np.testing.assert_allclose(reader.getChannelData('Fp1', 13, 50), toPhysical(digital[0][13:50]), atol=1e-12)
+    np.testing.assert_allclose(reader.getChannelData(2, 3, 9), toPhysical(digital[2][3:9]), atol=1e-12)
+    assert reader.getChannelData('Fp1', 40, 40).size == 0
+
+def test_sample_block_matches_per_channel_reads(tmp_path):
+    path = tmp_path / 'synthetic.edf'
+    makeRecording(path)
+    reader = EdfReader(path)
+    block = reader.getSampleBlock(['Fp2', 'Fp1'], 5, 37)
+    np.testing.assert_array_equal(block, reader.getData(['Fp2', 'Fp1'], 5, 37))
+    mixedRates = reader.getSampleBlock(['Fp1', 'Status'], 0, 8)
+    np.testing.assert_array_equal(mixedRates[1], reader.getChannelData('Status', 0, 8))
+
+def test_streamed_export_round_trips(tmp_path):
+    source = tmp_path / 'synthetic.edf'
+    digital = makeRecording(source)
+    reader = EdfReader(source)
+    exported = EdfReader(writeEdfInChunks(reader, tmp_path / 'export.edf', [2, 0], 3, 10, chunkRecords=2))
+    assert exported.channelNames == ['Status', 'Fp1']
+    assert exported.nRecords == 7
+    np.testing.assert_array_equal(exported.samplesPerRecord, [4, 16])
+    assert (exported.startTime - reader.startTime).total_seconds() == 3.0
+    np.testing.assert_array_equal(exported.channelView('Fp1').reshape(-1), digital[0][3 * 16:10 * 16])
+    np.testing.assert_array_equal(exported.channelView('Status').reshape(-1), digital[2][3 * 4:10 * 4])
+    np.testing.assert_allclose(exported.getChannelData('Fp1'), reader.getChannelData('Fp1', 3 * 16, 10 * 16))
+
+def test_streamed_export_clips_stop_record(tmp_path):
+    source = tmp_path / 'synthetic.edf'
+    digital = makeRecording(source)
+    reader = EdfReader(source)
+    exported = EdfReader(writeEdfInChunks(reader, tmp_path / 'export.edf', [1], 0, 100, chunkRecords=5))
+    assert exported.nRecords == reader.nRecords
+    np.testing.assert_array_equal(exported.channelView(0).reshape(-1), digital[1])
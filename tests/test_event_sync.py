@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from src.event_sync import matchEventsByType, alignEventsBanded, findEventTrainLag, fitClockDrift
+
+def makeSession(nTrials=20, seed=0):
+    """Return (names, onsets) of a synthetic session with jittered trial timing."""
+    rng = np.random.default_rng(seed)
+    names = ['StartReading', 'ITI', 'StartSaying', 'Fixation'] * nTrials
+    onsets = np.cumsum(1.0 + rng.uniform(0.0, 0.5, len(names)))
+    return names, onsets
+
+def rescanMatch(eegNames, audioNames):
+    """Reference greedy matcher that rescans the EEG events for every audio event."""
+    eegEventIndex, audioEventIndex = [], []
+    trackingIndex = 0
+    for audioIndex, name in enumerate(audioNames):
+        for eegIndex in range(trackingIndex, len(eegNames)):
+            if eegNames[eegIndex] == name:
+                eegEventIndex.append(eegIndex)
+                audioEventIndex.append(audioIndex)
+                trackingIndex = eegIndex + 1
+                break
+    return eegEventIndex, audioEventIndex
+
+def test_greedy_matches_rescan_reference():
+    rng = np.random.default_rng(2)
+    for _ in range(20):
+        eegNames = list(rng.choice(['A', 'B', 'C'], 40))
+        audioNames = list(rng.choice(['A', 'B', 'C', 'D'], 35))
+        result = matchEventsByType(eegNames, audioNames)
+        eegEventIndex, audioEventIndex = rescanMatch(eegNames, audioNames)
+        np.testing.assert_array_equal(result['eegEventIndex'], eegEventIndex)
+        np.testing.assert_array_equal(result['audioEventIndex'], audioEventIndex)
+
+def test_greedy_skips_filtered_event_types():
+    result = matchEventsByType(['A', 'B', 'A', 'B'], ['B', 'A', 'B'], eventTypes=['B'])
+    np.testing.assert_array_equal(result['eegEventIndex'], [1, 3])
+    np.testing.assert_array_equal(result['audioEventIndex'], [0, 2])
+
+def test_event_train_lag_recovers_offset():
+    names, onsets = makeSession()
+    audioOnsets = onsets + 1700000000.0
+    eegOnsets = audioOnsets + 12.34 + np.random.default_rng(3).normal(0.0, 0.002, onsets.size)
+    lag, score = findEventTrainLag(eegOnsets[5:], names[5:], audioOnsets, names)
+    assert abs(lag - 12.34) < 0.01
+    assert score >= (len(names) - 5) // 2
+
+def test_drift_fit_rejects_outliers():
+    rng = np.random.default_rng(4)
+    audioOnsetIndexes = np.sort(rng.uniform(0, 3.6e6, 200))
+    eegOnsetIndexes = 1500.0 + 0.51234 * audioOnsetIndexes + rng.normal(0.0, 0.5, 200)
+    eegOnsetIndexes[[10, 80, 150]] += [400.0, -250.0, 900.0]
+    fit = fitClockDrift(audioOnsetIndexes, eegOnsetIndexes)
+    assert abs(fit['slope'] - 0.51234) < 1e-5
+    assert abs(fit['intercept'] - 1500.0) < 1.0
+    np.testing.assert_array_equal(np.flatnonzero(~fit['inliers']), [10, 80, 150])
+
+def test_banded_matches_greedy_on_clean_sequences():
+    names, onsets = makeSession()
+    greedy = matchEventsByType(names, names)
+    banded = alignEventsBanded(names, names, onsets, onsets, band=5)
+    np.testing.assert_array_equal(banded['eegEventIndex'], greedy['eegEventIndex'])
+    np.testing.assert_array_equal(banded['audioEventIndex'], greedy['audioEventIndex'])
+    assert banded['missingEegEventIndex'].size == 0
+    assert banded['extraEegEventIndex'].size == 0
+
+def test_banded_reports_missing_trigger():
+    names, onsets = makeSession()
+    missing = 13
+    eegNames = names[:missing] + names[missing + 1:]
+    eegOnsets = np.delete(onsets, missing)
+    result = alignEventsBanded(eegNames, names, eegOnsets, onsets, band=5)
+    np.testing.assert_array_equal(result['missingEegEventIndex'], [missing])
+    np.testing.assert_array_equal(result['audioEventIndex'], np.delete(np.arange(len(names)), missing))
+    np.testing.assert_array_equal(result['eegEventIndex'], np.arange(len(eegNames)))
+
+def test_banded_raises_when_length_difference_exceeds_band():
+    with pytest.raises(ValueError, match='syncBand'):
+        alignEventsBanded(['A', 'B'], ['A', 'B'] * 4, np.arange(2.0), np.arange(8.0), band=2)
@@ -0,0 +1,61 @@
+import pickle
+
+import numpy as np
+
+from src.event_table import EventTable
+
+def makeTable():
+    return EventTable({
+        'trialType': ['StartReading', 'StartSaying', 'StartReading', 'StartSaying'],
+        'onset': [0.0, 1.5, 3.0, 4.5],
+        'eegOnsetIndex': np.array([0, 768, 1536, 2304], dtype=np.int64),
+        'word': [None, 'casa', None, 'perro'],
+    }, categorical=['trialType', 'word'])
+
+def test_columns_and_rows_round_trip():
+    events = makeTable()
+    assert len(events) == 4
+    assert events.columnNames == ['trialType', 'onset', 'eegOnsetIndex', 'word']
+    assert events.codes('trialType').dtype == np.int32
+    assert events['word'].tolist() == [None, 'casa', None, 'perro']
+    assert events.rows()[1] == ['StartSaying', 1.5, 768, 'casa']
+    assert events.row(3) == {'trialType': 'StartSaying', 'onset': 4.5, 'eegOnsetIndex': 2304, 'word': 'perro'}
+
+    rebuilt = EventTable(dict(zip(events.columnNames, map(list, zip(*events.rows())))), categorical=['trialType', 'word'])
+    assert rebuilt.rows() == events.rows()
+    assert rebuilt.fingerprint() == events.fingerprint()
+
+def test_row_selection():
+    events = makeTable()
+    view = events[1:3]
+    assert np.shares_memory(view.data['onset'], events.data['onset'])
+    assert view.rows() == events.rows()[1:3]
+    assert events[-1].rows() == [events.rows()[-1]]
+    assert events[2].row(0) == events.row(2)
+
+    saying = events[events.isin('trialType', ['StartSaying'])]
+    assert saying['word'].tolist() == ['casa', 'perro']
+    assert events[events.isin('onset', [3.0])]['eegOnsetIndex'].tolist() == [1536]
+    assert events[np.array([3, 0])]['trialType'].tolist() == ['StartSaying', 'StartReading']
+
+def test_pickle_round_trip_keeps_fingerprint():
+    events = makeTable()
+    restored = pickle.loads(pickle.dumps(events))
+    assert restored.rows() == events.rows()
+    assert restored.fingerprint() == events.fingerprint()
+    assert restored.fingerprint(['onset']) == events.fingerprint(['onset'])
+
+def test_fingerprint_tracks_content():
+    events = makeTable()
+    shifted = makeTable()
+    shifted.data['onset'] = shifted.data['onset'] + 0.001
+    assert shifted.fingerprint() != events.fingerprint()
+    assert shifted.fingerprint(['trialType', 'word']) == events.fingerprint(['trialType', 'word'])
+
+def test_add_column_position_and_replace():
+    events = makeTable()
+    events.addColumn('duration', np.zeros(4), position=2)
+    assert events.columnNames == ['trialType', 'onset', 'duration', 'eegOnsetIndex', 'word']
+    events.addColumn('onset', events['onset'] + 1.0)
+    assert events.columnNames[-1] == 'onset'
+    assert events.row(0)['onset'] == 1.0
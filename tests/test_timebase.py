@@ -0,0 +1,39 @@
+import numpy as np
+
+from src.timebase import Timebase
+
+def nearestIndex(timestamps, times):
+    """Brute-force nearest-sample lookup over a full timestamp array."""
+    return np.argmin(np.abs(timestamps[None, :] - np.asarray(times)[:, None]), axis=1)
+
+def test_affine_timebase_matches_nearest_lookup():
+    timebase = Timebase(1700000000.0, 512.0, 2048)
+    timestamps = 1700000000.0 + np.arange(2048) / 512.0
+    np.testing.assert_allclose(timebase.toArray(), timestamps)
+
+    times = np.random.default_rng(0).uniform(timestamps[0] - 0.5, timestamps[-1] + 0.5, 500)
+    np.testing.assert_array_equal(timebase.timeToIndex(times), nearestIndex(timestamps, times))
+    assert timebase.timeToIndex(timestamps[100] + 0.4 / 512.0) == 100
+
+def test_timebase_across_gap_matches_nearest_lookup():
+    first = 100.0 + np.arange(1000) / 250.0
+    second = first[-1] + 3.0 + np.arange(600) / 250.0
+    timestamps = np.concatenate((first, second))
+    timebase = Timebase.fromTimestamps(timestamps, 250.0)
+    np.testing.assert_array_equal(timebase.segmentIndices, [0, 1000])
+    np.testing.assert_allclose(timebase.toArray(), timestamps)
+
+    rng = np.random.default_rng(1)
+    times = np.concatenate((
+        rng.uniform(timestamps[0] - 1.0, timestamps[-1] + 1.0, 500),
+        rng.uniform(first[-1], second[0], 200),
+    ))
+    np.testing.assert_array_equal(timebase.timeToIndex(times), nearestIndex(timestamps, times))
+    np.testing.assert_array_equal(timebase.timeToIndex([first[-1] + 1.0, second[0] - 1.0]), [999, 1000])
+
+def test_shift_moves_every_segment():
+    timestamps = np.concatenate((np.arange(10) / 10.0, 5.0 + np.arange(10) / 10.0))
+    timebase = Timebase.fromTimestamps(timestamps, 10.0)
+    shifted = timebase.shift(2.5)
+    np.testing.assert_allclose(shifted.toArray(), timestamps + 2.5)
+    np.testing.assert_array_equal(shifted.timeToIndex(timestamps + 2.5), np.arange(20))